@@ -55,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.PerformanceMiddleware',
+    'main.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,16 @@ if os.environ.get('DJANGO_DATABASE_ENGINE') == 'django.db.backends.sqlite3':
             ),
         }
     }
+    # Second local database standing in for a read replica
+    if os.environ.get('DJANGO_DATABASE_REPLICA_NAME'):
+        DATABASES['replica_0'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(
+                BASE_DIR,
+                os.environ.get('DJANGO_DATABASE_REPLICA_NAME') + '.sqlite3'
+            ),
+            'TEST': {'MIRROR': 'default'},
+        }
 else:
     DATABASES = {
         'default': {
@@ -107,8 +119,37 @@ else:
             'PASSWORD': os.environ.get('DJANGO_DATABASE_PASSWORD'),
             'HOST': os.environ.get('DJANGO_DATABASE_HOST'),
             'PORT': os.environ.get('DJANGO_DATABASE_PORT'),
+            # Used by ENGINE main.db.backends.postgresql, which takes
+            # connections from a pool per process instead of connecting on
+            # every request. MAX_SIZE 0 disables the pool.
+            'POOL': {
+                'MAX_SIZE': int(os.environ.get(
+                    'DJANGO_DATABASE_POOL_MAX_SIZE', 10)),
+                'IDLE_TIMEOUT': int(os.environ.get(
+                    'DJANGO_DATABASE_POOL_IDLE_TIMEOUT', 300)),
+                'CHECKOUT_TIMEOUT': int(os.environ.get(
+                    'DJANGO_DATABASE_POOL_CHECKOUT_TIMEOUT', 5)),
+            },
         }
     }
+    # Read replicas on other hosts with the same credentials; in tests they
+    # mirror the default database
+    for number, host in enumerate(filter(None, os.environ.get(
+            'DJANGO_DATABASE_REPLICA_HOSTS', '').split(','))):
+        DATABASES['replica_{}'.format(number)] = dict(
+            DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+
+# Users and tokens are read from replicas, other DATABASES than default.
+# Clients which wrote are pinned to default for STICKY_SECONDS; BACKEND must
+# be a cache alias shared by every worker when there are replicas, see
+# main.routers.
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+REPLICA_ROUTING = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': int(os.environ.get('DJANGO_REPLICA_STICKY_SECONDS', 5)),
+    'MAX_SIZE': 100000,
+    'BACKEND': os.environ.get('DJANGO_REPLICA_STICKY_BACKEND'),
+}
 
 
 # Password validation
@@ -151,32 +192,161 @@ STATIC_URL = '/static/'
 
 
 REST_FRAMEWORK = {
+    # Runs the session, token or signed token authentication depending on
+    # the Authorization header and session cookie of the request
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-    ), 
+        'main.api.authentication.DispatchingAuthentication',
+    ),
+    # Tokens issued by /api/v1/auth/login: "db" tokens stored in
+    # authtoken_token or stateless "signed" tokens, sent as "Bearer <token>"
+    "TOKEN_TYPE": os.environ.get('DJANGO_TOKEN_TYPE', 'db'),
     "DEFAULT_PERMISSION_CLASSES": (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Fixed window limits of main.api.throttling, keyed by
+    # <throttle_scope>_<ident_name>
+    "DEFAULT_THROTTLE_RATES": {
+        'login_email': '10/min',
+        'login_ip': '60/min',
+        'register_email': '5/min',
+        'register_ip': '30/min',
+        'register_bulk_ip': '10/min',
+    },
+    # Number of reverse proxies in front of the application whose
+    # X-Forwarded-For entries are trusted to find the client address. With
+    # 0 the header is ignored, otherwise clients could pick any address.
+    "NUM_PROXIES": int(os.environ.get('DJANGO_NUM_PROXIES', 0)),
+}
+
+# Api tokens older than TTL seconds are rejected and removed by
+# "manage.py purge_tokens". With SLIDING the age of a used token is reset, at
+# most once per RENEW_AFTER seconds.
+TOKEN_EXPIRY = {
+    'TTL': int(os.environ.get('DJANGO_TOKEN_TTL', 30 * 24 * 3600)),
+    'SLIDING': os.environ.get('DJANGO_TOKEN_SLIDING', 'on') == 'on',
+    'RENEW_AFTER': 3600,
+}
+
+# Lifetime of signed api tokens and how often workers load new revocations
+# and, to catch rows committed out of id order, all revocations
+SIGNED_TOKEN = {
+    'TTL': int(os.environ.get('DJANGO_SIGNED_TOKEN_TTL', 24 * 3600)),
+    'REFRESH_INTERVAL': 5,
+    'FULL_REFRESH_INTERVAL': 60,
+}
+
+# Storage of throttling counters, see TOKEN_CACHE
+THROTTLE_CACHE = {
+    'MAX_SIZE': 100000,
+    'TIMEOUT': 3600,
+    'BACKEND': os.environ.get('DJANGO_THROTTLE_CACHE_BACKEND'),
 }
 
 AUTH_USER_MODEL = 'email_auth.User'
 
-# SILENCED_SYSTEM_CHECKS = ['auth.E003', 'auth.W004']
+# Cache of resolved api tokens. BACKEND is an alias from CACHES; when it is
+# set every worker shares the cache and logout is seen by all of them at
+# once. Otherwise each process keeps its own cache and accepts a token
+# revoked by another worker until its entry expires, so TIMEOUT is short.
+TOKEN_CACHE = {
+    'MAX_SIZE': int(os.environ.get('DJANGO_TOKEN_CACHE_SIZE', 10000)),
+    'BACKEND': os.environ.get('DJANGO_TOKEN_CACHE_BACKEND'),
+}
+TOKEN_CACHE['TIMEOUT'] = int(os.environ.get(
+    'DJANGO_TOKEN_CACHE_TIMEOUT', 300 if TOKEN_CACHE['BACKEND'] else 10))
+
+# Email is unique for active users only, enforced by a partial unique index
+# (see email_auth migration 0008) and used by CustomBackend
+SILENCED_SYSTEM_CHECKS = ['auth.W004']
+# CustomBackend extends ModelBackend, so it also answers permission checks.
+# Listing ModelBackend after it would hash the password a second time on
+# every failed login.
 AUTHENTICATION_BACKENDS = (
-    'main.custom_user_backend.CustomBackend', 
-    'django.contrib.auth.backends.ModelBackend'
-    )
+    'main.custom_user_backend.CustomBackend',
+)
+
+# Executor running password hashing. main.hashing.ProcessPoolExecutor moves
+# hashing off the request thread into WORKERS processes; at most QUEUE_DEPTH
+# hashes may wait for a worker before requests are answered with 503.
+PASSWORD_HASHING = {
+    'EXECUTOR': os.environ.get(
+        'DJANGO_HASHING_EXECUTOR', 'main.hashing.InlineExecutor'),
+}
+if os.environ.get('DJANGO_HASHING_WORKERS'):
+    PASSWORD_HASHING['WORKERS'] = int(os.environ['DJANGO_HASHING_WORKERS'])
+if os.environ.get('DJANGO_HASHING_QUEUE_DEPTH'):
+    PASSWORD_HASHING['QUEUE_DEPTH'] = int(
+        os.environ['DJANGO_HASHING_QUEUE_DEPTH'])
+if os.environ.get('DJANGO_HASHING_QUEUE_TIMEOUT'):
+    PASSWORD_HASHING['QUEUE_TIMEOUT'] = float(
+        os.environ['DJANGO_HASHING_QUEUE_TIMEOUT'])
+
+# Clients allowed to read /metrics: addresses of ALLOWED_IPS (comma
+# separated in DJANGO_METRICS_ALLOWED_IPS, none by default), requests with
+# "Authorization: Bearer <TOKEN>" and staff users logged in to the admin.
+# Behind a reverse proxy set DJANGO_NUM_PROXIES, otherwise every request
+# comes from the address of the proxy.
+METRICS = {
+    'ALLOWED_IPS': [
+        address.strip() for address in os.environ.get(
+            'DJANGO_METRICS_ALLOWED_IPS', '').split(',')
+        if address.strip()
+    ],
+    'TOKEN': os.environ.get('DJANGO_METRICS_TOKEN'),
+}
+
+# Rendered /api/v1/auth/info responses keyed by user ETag, see TOKEN_CACHE
+INFO_CACHE = {
+    'MAX_SIZE': 10000,
+    'TIMEOUT': 3600,
+    'BACKEND': os.environ.get('DJANGO_INFO_CACHE_BACKEND'),
+}
+
+# Bloom filter of registered emails used to reject logins of unknown emails
+# without a database query. BACKEND must be a cache alias shared by every
+# worker process, without it the filter is off, see main.email_filter.
+EMAIL_FILTER = {
+    'CAPACITY': 1000000,
+    'ERROR_RATE': 0.01,
+    'REBUILD_INTERVAL': 3600,
+    'BACKEND': os.environ.get('DJANGO_EMAIL_FILTER_BACKEND'),
+}
+EMAIL_FILTER['ENABLED'] = os.environ.get(
+    'DJANGO_EMAIL_FILTER', 'on' if EMAIL_FILTER['BACKEND'] else 'off') == 'on'
+
 
+# Limits of /api/v1/auth/register/bulk: number of users per request and
+# number of users validated, hashed and inserted together. Every user costs
+# a password hash, MAX_ITEMS keeps a request within the request timeout.
+BULK_REGISTER = {
+    'MAX_ITEMS': int(os.environ.get('DJANGO_BULK_REGISTER_MAX_ITEMS', 100)),
+    'BATCH_SIZE': 100,
+}
+
+# The first hasher hashes new passwords; stored hashes made by another
+# hasher or with another number of iterations are rehashed on login.
+# Use "manage.py calibrate_hasher" to choose the number of iterations.
+PASSWORD_HASHERS = [
+    'main.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+]
+if os.environ.get('DJANGO_HASHER_ITERATIONS'):
+    PASSWORD_HASHER_ITERATIONS = int(os.environ['DJANGO_HASHER_ITERATIONS'])
+
+# Length, character classes and breached passwords are checked in one pass.
+# BREACHED_PASSWORDS_PATH is a digest file built by
+# "manage.py build_password_list", shared by workers through mmap.
 AUTH_PASSWORD_VALIDATORS = [
     {
-        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+        'NAME': 'main.validators.PasswordPolicyValidator',
         'OPTIONS': {
             'min_length': 8,
+            'breached_passwords_path': os.environ.get(
+                'DJANGO_BREACHED_PASSWORDS_PATH'),
         }
     },
-    {
-        'NAME': 'main.validators.CustomPasswordValidator'
-    },
 ]
 
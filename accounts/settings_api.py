@@ -0,0 +1,43 @@
+"""
+Settings of api-only nodes, selected with
+DJANGO_SETTINGS_MODULE=accounts.settings_api.
+
+Only the apps and middleware the /api/v1/auth/ endpoints need are loaded:
+no admin, sessions, messages, CSRF or templates, and api requests are
+authenticated by tokens only. "manage.py bench_profiles" compares startup
+time and per-request overhead with accounts.settings.
+"""
+# pylint: disable=wildcard-import,unused-wildcard-import
+from accounts.settings import *
+
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'email_auth',
+    'main'
+]
+
+MIDDLEWARE = [
+    'main.middleware.PerformanceMiddleware',
+    'main.middleware.ReplicaStickinessMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'accounts.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_AUTHENTICATION_CLASSES=(
+        'main.api.authentication.TokenOnlyAuthentication',
+    ),
+    # The browsable api needs templates and sessions
+    DEFAULT_RENDERER_CLASSES=(
+        'rest_framework.renderers.JSONRenderer',
+    ),
+)
@@ -1,7 +1,10 @@
 from django.conf.urls import url, include
 from django.contrib import admin
 
+from main.metrics import metrics_view
+
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^metrics$', metrics_view, name='metrics'),
     url(r'^api/v1/', include('accounts.api_urls', namespace='api')),
 ]
@@ -0,0 +1,8 @@
+from django.conf.urls import url, include
+
+from main.metrics import metrics_view
+
+urlpatterns = [
+    url(r'^metrics$', metrics_view, name='metrics'),
+    url(r'^api/v1/', include('accounts.api_urls', namespace='api')),
+]
@@ -1,15 +1,34 @@
 """Additional configuration for pytest"""
+import contextlib
 import datetime
 import os
 
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.authtoken.models import Token
 
+from main import hashing
+from main.api.signed_tokens import revocation_list
+from main.cache import clear_caches
+from main.email_filter import email_filter
+from main.metrics import registry
+
 
 User = get_user_model()
 
 
+def pytest_collection_modifyitems(items):
+    """Skip tests marked with postgresql on other databases"""
+    if connection.vendor == 'postgresql':
+        return
+    skip = pytest.mark.skip(reason='needs PostgreSQL')
+    for item in items:
+        if 'postgresql' in item.keywords:
+            item.add_marker(skip)
+
+
 # pylint: disable=redefined-outer-name,unused-argument,no-member
 @pytest.fixture(scope='session')
 def django_db_setup(django_db_setup, django_db_blocker):
@@ -23,6 +42,58 @@ def django_db_setup(django_db_setup, django_db_blocker):
         Token.objects.create(user=user_one)
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Do not let cached data leak between tests"""
+    clear_caches()
+    email_filter.reset()
+    revocation_list.reset()
+    registry.reset()
+    yield
+    clear_caches()
+    email_filter.reset()
+    revocation_list.reset()
+    registry.reset()
+
+
+@pytest.fixture
+def shared_email_filter(settings):
+    """Enable email_filter as with a shared BACKEND and build it"""
+    settings.EMAIL_FILTER = dict(settings.EMAIL_FILTER, ENABLED=True,
+                                 BACKEND='default')
+    email_filter.build()
+
+
+@pytest.fixture
+def budget():
+    """
+    Context manager failing the test when the code inside runs more
+    queries or password hashes than allowed; the executed SQL is listed.
+    Savepoints are not counted: tests run inside a transaction, so they
+    stand for BEGIN and COMMIT, which are not captured outside of tests.
+
+        with budget(queries=1, hashes=0):
+            client.get(...)
+    """
+    @contextlib.contextmanager
+    def check(queries, hashes=0):
+        hash_count = hashing.metrics.count
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        hash_count = hashing.metrics.count - hash_count
+        query_count = len([query for query in captured
+                           if 'SAVEPOINT' not in query['sql']])
+        if query_count > queries or hash_count > hashes:
+            pytest.fail(
+                'Budget of {} queries and {} hashes exceeded: {} queries, '
+                '{} hashes\n{}'.format(
+                    queries, hashes, query_count, hash_count,
+                    '\n'.join('{}. {}'.format(number, query['sql'])
+                              for number, query in enumerate(captured, 1))),
+                pytrace=False)
+    return check
+
+
 @pytest.mark.django_db
 def get_token(email='user_one@example.com'):
     """
@@ -1,6 +1,131 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IS_POPUP_VAR
 from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import IntegrityError, connections, router, transaction
+from django.utils.encoding import force_text
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext as _
 
 User = get_user_model()
 
-admin.site.register(User)
\ No newline at end of file
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which does not count the whole table: the number of rows of
+    unfiltered lists is estimated from the statistics of PostgreSQL, filtered
+    lists and other databases are counted up to max_count rows. Rows past
+    max_count are not listed, capped tells whether there are such rows.
+    """
+    max_count = 10000
+    capped = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class '
+                               'WHERE relname = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.max_count:
+                return int(row[0])
+        count = queryset[:self.max_count + 1].count()
+        if count > self.max_count:
+            self.capped = True
+            return self.max_count
+        return count
+
+
+class DuplicateEmail(Exception):
+    """Raised by UserAdmin.save_model when the email is taken"""
+
+    def __init__(self, form):
+        super(DuplicateEmail, self).__init__(form)
+        self.form = form
+
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    """
+    Changelist of users which neither counts the table nor searches it with
+    unindexed ILIKE lookups, see UserManager.search. When more users match
+    than the paginator counts, a warning asks to narrow the search.
+    Emails of active users are unique by a partial index only, a duplicate
+    is reported on the form when the index rejects it.
+    """
+    list_display = ('id', 'email', 'first_name', 'last_name', 'is_active',
+                    'is_staff')
+    ordering = ('-id',)
+    search_fields = ('email', 'first_name', 'last_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset & self.model.objects.search(search_term), False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super(UserAdmin, self).changelist_view(
+            request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        paginator = getattr(changelist, 'paginator', None)
+        if getattr(paginator, 'capped', False):
+            self.message_user(
+                request,
+                'More than {0} users match, only the first {0} are listed. '
+                'Narrow the search to find the others.'.format(
+                    paginator.max_count),
+                messages.WARNING)
+        return response
+
+    def save_model(self, request, obj, form, change):
+        try:
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                super(UserAdmin, self).save_model(request, obj, form, change)
+        except IntegrityError:
+            form.add_error('email', obj.unique_error_message(
+                self.model, ('email',)))
+            raise DuplicateEmail(form)
+
+    def changeform_view(self, request, object_id=None, form_url='',
+                        extra_context=None):
+        try:
+            return super(UserAdmin, self).changeform_view(
+                request, object_id, form_url, extra_context)
+        except DuplicateEmail as error:
+            return self.render_duplicate_email(
+                request, error.form, object_id, form_url, extra_context)
+
+    def render_duplicate_email(self, request, form, object_id, form_url,
+                               extra_context):
+        """Render the change form again with the error of the email"""
+        add = object_id is None
+        obj = None if add else form.instance
+        admin_form = helpers.AdminForm(
+            form,
+            list(self.get_fieldsets(request, obj)),
+            self.get_prepopulated_fields(request, obj),
+            self.get_readonly_fields(request, obj),
+            model_admin=self)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=(_('Add %s') if add else _('Change %s')) %
+            force_text(self.model._meta.verbose_name),
+            adminform=admin_form,
+            object_id=object_id,
+            original=obj,
+            is_popup=IS_POPUP_VAR in request.POST,
+            media=self.media + admin_form.media,
+            inline_admin_formsets=[],
+            errors=helpers.AdminErrorList(form, []),
+            preserved_filters=self.get_preserved_filters(request),
+        )
+        context.update(extra_context or {})
+        return self.render_change_form(request, context, add=add,
+                                       change=not add, obj=obj,
+                                       form_url=form_url)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+INDEX_NAME = 'auth_user_email_lower'
+
+CREATE_INDEX = {
+    # CONCURRENTLY does not lock the table for writes while the index is
+    # built, so the migration is safe on large tables.
+    'postgresql': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                  'ON auth_user (LOWER(email))',
+    'sqlite': 'CREATE INDEX IF NOT EXISTS {name} ON auth_user (LOWER(email))',
+}
+
+DROP_INDEX = {
+    'postgresql': 'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+    'sqlite': 'DROP INDEX IF EXISTS {name}',
+}
+
+
+def run_for_vendor(statements):
+    def operation(apps, schema_editor):
+        sql = statements.get(schema_editor.connection.vendor)
+        if sql:
+            schema_editor.execute(sql.format(name=INDEX_NAME))
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('email_auth', '0005_auto_20170628_2002'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(CREATE_INDEX),
+            run_for_vendor(DROP_INDEX),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+CONSTRAINT_NAME = 'auth_user_version_check'
+
+ADD_COLUMN = {
+    # From PostgreSQL 11 a column with a constant default is added without
+    # rewriting the table; the CHECK of PositiveIntegerField is added
+    # separately, inline it would scan the table under the exclusive lock
+    # of ALTER TABLE
+    'postgresql': (
+        'ALTER TABLE auth_user ADD COLUMN "version" '
+        'integer NOT NULL DEFAULT 1',
+        'ALTER TABLE auth_user DROP CONSTRAINT IF EXISTS {name}',
+        'ALTER TABLE auth_user ADD CONSTRAINT {name} '
+        'CHECK ("version" >= 0) NOT VALID',
+        # Validation scans the table without blocking reads and writes
+        'ALTER TABLE auth_user VALIDATE CONSTRAINT {name}',
+    ),
+}
+
+DROP_COLUMN = {
+    'postgresql': (
+        'ALTER TABLE auth_user DROP COLUMN IF EXISTS "version"',
+    ),
+}
+
+
+class AddFieldWithoutLock(migrations.AddField):
+    """
+    AddField which on PostgreSQL runs the statements of ADD_COLUMN and
+    DROP_COLUMN, so auth_user is neither rewritten nor locked while the
+    CHECK is validated; other databases add the field as usual
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        vendor = schema_editor.connection.vendor
+        if vendor not in ADD_COLUMN:
+            super(AddFieldWithoutLock, self).database_forwards(
+                app_label, schema_editor, from_state, to_state)
+            return
+        for statement in ADD_COLUMN[vendor]:
+            schema_editor.execute(statement.format(name=CONSTRAINT_NAME))
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        vendor = schema_editor.connection.vendor
+        if vendor not in DROP_COLUMN:
+            super(AddFieldWithoutLock, self).database_backwards(
+                app_label, schema_editor, from_state, to_state)
+            return
+        for statement in DROP_COLUMN[vendor]:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    # Every statement commits on its own, so the lock taken to add the
+    # column is released before the constraint is validated
+    atomic = False
+
+    dependencies = [
+        ('email_auth', '0006_email_lower_index'),
+    ]
+
+    operations = [
+        AddFieldWithoutLock(
+            model_name='user',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
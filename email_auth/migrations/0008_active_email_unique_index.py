@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+INDEX_NAME = 'auth_user_active_email_lower_uniq'
+LOWER_INDEX_NAME = 'auth_user_email_lower'
+
+FIND_DUPLICATES = ('SELECT LOWER(email) FROM auth_user WHERE is_active '
+                   'GROUP BY LOWER(email) HAVING COUNT(*) > 1 LIMIT 10')
+
+CREATE_INDEX = {
+    # CONCURRENTLY does not lock the table for writes while the index is
+    # built, so the migration is safe on large tables.
+    'postgresql': 'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                  'ON auth_user (LOWER(email)) WHERE is_active',
+    'sqlite': 'CREATE UNIQUE INDEX IF NOT EXISTS {name} '
+              'ON auth_user (LOWER(email)) WHERE is_active',
+}
+
+DROP_INDEX = {
+    'postgresql': 'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+    'sqlite': 'DROP INDEX IF EXISTS {name}',
+}
+
+# Whether index is valid; CREATE INDEX CONCURRENTLY leaves an invalid index
+# behind when it fails, e.g. on duplicates or when it is cancelled
+INDEX_VALID = ('SELECT indisvalid FROM pg_index '
+               'WHERE indexrelid = to_regclass(%s)')
+
+CREATE_LOWER_INDEX = {
+    'postgresql': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                  'ON auth_user (LOWER(email))',
+    'sqlite': 'CREATE INDEX IF NOT EXISTS {name} ON auth_user (LOWER(email))',
+}
+
+
+def email_fields(apps, unique):
+    """Model of the migration state and its email field with unique"""
+    User = apps.get_model('email_auth', 'User')
+    old_field = User._meta.get_field('email')
+    new_field = models.EmailField(verbose_name='email address',
+                                  max_length=255, unique=unique)
+    new_field.set_attributes_from_name('email')
+    return User, old_field, new_field
+
+
+def email_constraints(schema_editor):
+    """Names of the unique constraint and indexes on email alone"""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, 'auth_user')
+    return [(name, constraint) for name, constraint in constraints.items()
+            if constraint['columns'] == ['email'] and
+            not constraint['primary_key']]
+
+
+def index_valid(schema_editor, name):
+    """Whether index name is valid, None when it does not exist"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(INDEX_VALID, [name])
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def make_email_unique_for_active_users(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_INDEX:
+        # Partial indexes are not supported, the global constraint is kept
+        return
+
+    if vendor == 'sqlite':
+        # SQLite rebuilds the table to drop the constraint, which also drops
+        # custom indexes, so it has to be done before they are created
+        schema_editor.alter_field(*email_fields(apps, unique=False))
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(FIND_DUPLICATES)
+        duplicates = [row[0] for row in cursor.fetchall()]
+    if duplicates:
+        raise RuntimeError(
+            'Active users share emails {}, deactivate all but one of them '
+            'before migrating'.format(', '.join(duplicates)))
+    if vendor == 'postgresql' and \
+            index_valid(schema_editor, INDEX_NAME) is False:
+        # Left behind by a failed run, IF NOT EXISTS would keep it
+        schema_editor.execute(DROP_INDEX[vendor].format(name=INDEX_NAME))
+    schema_editor.execute(CREATE_INDEX[vendor].format(name=INDEX_NAME))
+
+    if vendor == 'postgresql':
+        # The global constraint is dropped only once the partial index
+        # enforces uniqueness of active users
+        if not index_valid(schema_editor, INDEX_NAME):
+            raise RuntimeError(
+                'Index {} is not valid, the unique constraint on email is '
+                'kept; run the migration again'.format(INDEX_NAME))
+        for name, constraint in email_constraints(schema_editor):
+            if constraint['unique']:
+                schema_editor.execute(
+                    'ALTER TABLE auth_user DROP CONSTRAINT {}'.format(name))
+            elif constraint['index']:
+                schema_editor.execute(DROP_INDEX[vendor].format(name=name))
+
+    # Lookups by email use the new index
+    schema_editor.execute(DROP_INDEX[vendor].format(name=LOWER_INDEX_NAME))
+
+
+def make_email_unique(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_INDEX:
+        return
+
+    schema_editor.execute(CREATE_LOWER_INDEX[vendor].format(
+        name=LOWER_INDEX_NAME))
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE auth_user ADD CONSTRAINT '
+                              'auth_user_email_key UNIQUE (email)')
+    schema_editor.execute(DROP_INDEX[vendor].format(name=INDEX_NAME))
+    if vendor == 'sqlite':
+        User, _, old_field = email_fields(apps, unique=False)
+        _, _, new_field = email_fields(apps, unique=True)
+        schema_editor.alter_field(User, old_field, new_field)
+        schema_editor.execute(CREATE_LOWER_INDEX[vendor].format(
+            name=LOWER_INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('email_auth', '0007_user_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    make_email_unique_for_active_users,
+                    make_email_unique,
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='user',
+                    name='email',
+                    field=models.EmailField(max_length=255,
+                                            verbose_name='email address'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Columns searched by UserManager.search, indexed as lower(column)
+INDEXES = (
+    ('auth_user_email_lower_trgm', 'email'),
+    ('auth_user_first_name_lower_trgm', 'first_name'),
+    ('auth_user_last_name_lower_trgm', 'last_name'),
+)
+
+CREATE_EXTENSION = {
+    # Trigram indexes serve LIKE 'query%' as well as LIKE '%query%'
+    'postgresql': 'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+}
+
+CREATE_INDEX = {
+    # CONCURRENTLY does not lock the table for writes while the index is
+    # built, so the migration is safe on large tables.
+    'postgresql': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                  'ON auth_user USING gin (LOWER({column}) gin_trgm_ops)',
+}
+
+DROP_INDEX = {
+    'postgresql': 'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+}
+
+# Whether index is valid; CREATE INDEX CONCURRENTLY leaves an invalid index
+# behind when it fails or is cancelled
+INDEX_VALID = ('SELECT indisvalid FROM pg_index '
+               'WHERE indexrelid = to_regclass(%s)')
+
+
+def index_valid(schema_editor, name):
+    """Whether index name is valid, None when it does not exist"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(INDEX_VALID, [name])
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_INDEX:
+        # Substring search can not use B-tree indexes, nothing to create
+        return
+    schema_editor.execute(CREATE_EXTENSION[vendor])
+    for name, column in INDEXES:
+        if index_valid(schema_editor, name) is False:
+            # Left behind by a failed run, IF NOT EXISTS would keep it
+            schema_editor.execute(DROP_INDEX[vendor].format(name=name))
+        schema_editor.execute(CREATE_INDEX[vendor].format(
+            name=name, column=column))
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in DROP_INDEX:
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(DROP_INDEX[vendor].format(name=name))
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('email_auth', '0008_active_email_unique_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
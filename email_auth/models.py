@@ -6,23 +6,55 @@ against the email field in addition to the username fields.
 This alternative implementation is activated by setting ``AUTH_USER_MODEL = 'shop.User'`` in
 settings.py, otherwise the default Django or another customized implementation will be used.
 """
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
-from django.core.exceptions import ValidationError
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.core.validators import RegexValidator
-from main.validators import CustomPasswordValidator
+from main import hashing
+from main.email_filter import email_filter
 from django.contrib.auth import password_validation
 
+# Allows ``email__lower`` lookups which are served by the lower(email) index
+# and ``first_name__lower`` lookups of user search
+models.CharField.register_lookup(Lower)
+
 
 class UserManager(BaseUserManager):
-    def get_by_natural_key(self, username):
+    def get_by_natural_key(self, email):
+        """Returns the active user with the given email, see get_by_email"""
+        return self.get(is_active=True, email__lower=email.lower())
+
+    def get_by_email(self, email):
+        """
+        Returns the active user with the given email compared
+        case-insensitively or None. Runs a single query that uses the
+        unique index on lower(email) of active users.
+        """
+        if not email:
+            return None
         try:
-            return self.get(username=username)
+            return self.get_by_natural_key(email)
         except self.model.DoesNotExist:
-            return self.get(is_active=True, email=username)
+            return None
+
+    def search(self, query):
+        """
+        Returns users whose email starts with query or whose first or last
+        name contains it, compared case-insensitively. On PostgreSQL the
+        lookups are served by the trigram indexes of migration 0009.
+        """
+        query = query.strip().lower()
+        if not query:
+            return self.all()
+        return self.filter(
+            Q(email__lower__startswith=query) |
+            Q(first_name__lower__contains=query) |
+            Q(last_name__lower__contains=query)
+        )
 
     def create_user(self, email, password=None):
         """
@@ -40,6 +72,7 @@ class UserManager(BaseUserManager):
 
         user.set_password(password)
         user.save(using=self._db)
+        email_filter.add(user.email)
         return user
 
     def create_superuser(self, email, password):
@@ -62,12 +95,13 @@ class User(AbstractUser):
     """
     Alternative implementation of Django's User model allowing to authenticate against the email
     field in addition to the username field, which remains the primary unique identifier. The
-    email field is only used in addition. It must be unique only for users marked as active.
+    email field is only used in addition. It must be unique only for users marked as active,
+    which is enforced by a partial unique index on lower(email), see migration 0008. Deactivated
+    and deleted users keep their email, which may be registered again.
     """
     email = models.EmailField(
         verbose_name='email address',
         max_length=255,
-        unique=True,
     )
     username=models.CharField(
         max_length=30, 
@@ -76,6 +110,11 @@ class User(AbstractUser):
         unique=False, 
         verbose_name='username'
     )
+    # Incremented by every update through the api, used for optimistic
+    # concurrency control and ETags
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Set when the user deleted the account; deleted users are inactive
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     objects = UserManager()
 
@@ -89,6 +128,12 @@ class User(AbstractUser):
         verbose_name_plural = _("Customers")
         swappable = 'AUTH_USER_MODEL'
 
+    def save(self, *args, **kwargs):
+        """Full saves of existing users change their version"""
+        if self.pk is not None and kwargs.get('update_fields') is None:
+            self.version += 1
+        super(User, self).save(*args, **kwargs)
+
     def get_username(self):
         return self.email
 
@@ -97,6 +142,24 @@ class User(AbstractUser):
             return self.username
         return self.email or '<anonymous>'
 
+    def set_password(self, raw_password):
+        """Hash password with the configured hashing executor"""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Check password with the configured hashing executor and upgrade the
+        stored hash when the hasher settings have changed.
+        """
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes,
+            # so only the password column is written and version is kept.
+            self._password = None
+            type(self).objects.filter(pk=self.pk).update(password=self.password)
+        return hashing.check_password(raw_password, self.password, setter)
+
     def get_full_name(self):
         full_name = super(User, self).get_full_name()
         if full_name:
@@ -109,15 +172,17 @@ class User(AbstractUser):
             return short_name
         return self.email
 
-    def validate_unique(self, exclude=None):
+    def deactivate(self, delete=False):
         """
-        Since the email address is used as the primary identifier, we must ensure that it is
-        unique. However, this can not be done on the field declaration since is only applies to
-        active users. Inactive users can not login anyway, so we don't need a unique constraint
-        for them.
+        Deactivate the user, who can not log in anymore and whose email may
+        be registered again. With delete the account is marked as deleted.
+        Only the changed columns are written.
         """
-        super(User, self).validate_unique(exclude)
-        if self.email and get_user_model().objects.exclude(id=self.id).filter(is_active=True,
-                                                                              email__exact=self.email).exists():
-            msg = _("A customer with the e-mail address ‘{email}’ already exists.")
-            raise ValidationError({'email': msg.format(email=self.email)})
+        changes = {'is_active': False}
+        if delete:
+            changes['deleted_at'] = timezone.now()
+        type(self).objects.filter(pk=self.pk).update(
+            version=models.F('version') + 1, **changes)
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.version += 1
@@ -0,0 +1,216 @@
+"""Authentication classes for account application api"""
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication, SessionAuthentication, TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+
+from main.cache import build_cache
+from main.metrics import registry
+
+from .signed_tokens import SignedToken, revocation_list
+
+
+# pylint: disable=invalid-name
+token_cache = build_cache('token', getattr(settings, 'TOKEN_CACHE', None))
+# Users authenticated by signed tokens, keyed by user id
+user_cache = build_cache('user', getattr(settings, 'TOKEN_CACHE', None))
+# Tokens issued on login, keyed by user id
+user_token_cache = build_cache('user-token',
+                               getattr(settings, 'TOKEN_CACHE', None))
+
+
+def token_expiry():
+    """TOKEN_EXPIRY settings completed with defaults"""
+    return dict({
+        'TTL': None,
+        'SLIDING': False,
+        'RENEW_AFTER': 3600,
+    }, **getattr(settings, 'TOKEN_EXPIRY', {}))
+
+
+def token_expired(token, now=None):
+    """
+    Check whether token is older than the configured TTL
+    :param token: Token object
+    :return: True when token has expired
+    """
+    ttl = token_expiry()['TTL']
+    if ttl is None:
+        return False
+    now = now or timezone.now()
+    return token.created < now - datetime.timedelta(seconds=ttl)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that keeps resolved (user, token) pairs in
+    ``token_cache`` so repeated requests with the same token do not hit
+    the database.
+
+    Tokens older than ``TOKEN_EXPIRY['TTL']`` seconds are rejected. With
+    ``TOKEN_EXPIRY['SLIDING']`` the age of a used token is reset, at most
+    once per ``RENEW_AFTER`` seconds to keep writes rare.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = token_cache.get(key)
+        if credentials is None:
+            credentials = super(CachedTokenAuthentication, self)\
+                .authenticate_credentials(key)
+            token_cache.set(key, credentials)
+
+        token = credentials[1]
+        now = timezone.now()
+        if token_expired(token, now):
+            invalidate_token(key, token.user_id)
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        expiry = token_expiry()
+        if expiry['SLIDING'] and token.created < \
+                now - datetime.timedelta(seconds=expiry['RENEW_AFTER']):
+            # pylint: disable=no-member
+            Token.objects.filter(key=key).update(created=now)
+            token.created = now
+            token_cache.set(key, credentials)
+        return credentials
+
+    def authenticate_header(self, request):
+        # Unauthenticated requests get 403 like with SessionAuthentication
+        # first, also on api-only nodes where it is not installed
+        return None
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """
+    Authentication by signed tokens sent as "Authorization: Bearer <token>".
+    Tokens are verified without database access; users are kept in
+    ``user_cache`` and revocations in the in-memory ``revocation_list``.
+    """
+    keyword = 'Bearer'
+
+    def authenticate_credentials(self, key):
+        token = SignedToken.load(key)
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if token.expired():
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        if revocation_list.is_revoked(token):
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        user = user_cache.get(token.user_id)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel.objects.get(pk=token.user_id)
+            except UserModel.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            user_cache.set(token.user_id, user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return (user, token)
+
+
+class DispatchingAuthentication(BaseAuthentication):
+    """
+    Runs only the authenticator matching the request instead of a chain:
+    the one of the Authorization scheme when the header is sent, session
+    authentication when the session cookie is sent. Time spent by every
+    scheme is observed by the authentication_duration_seconds histogram.
+    """
+    schemes = {
+        'token': CachedTokenAuthentication,
+        'bearer': SignedTokenAuthentication,
+    }
+    sessions = True
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if header:
+            scheme = header[0].decode('latin-1').lower()
+            authenticator = self.schemes.get(scheme)
+            if authenticator is None:
+                return None
+        elif self.sessions and \
+                settings.SESSION_COOKIE_NAME in request.COOKIES:
+            scheme, authenticator = 'session', SessionAuthentication
+        else:
+            return None
+
+        started = time.perf_counter()
+        try:
+            return authenticator().authenticate(request)
+        finally:
+            registry.observe('authentication_duration_seconds', scheme,
+                             time.perf_counter() - started,
+                             label_name='scheme')
+
+    def authenticate_header(self, request):
+        # Unauthenticated requests get 403 like with SessionAuthentication
+        # first
+        return None
+
+
+class TokenOnlyAuthentication(DispatchingAuthentication):
+    """DispatchingAuthentication ignoring the session cookie"""
+    sessions = False
+
+
+def token_type():
+    """Type of tokens issued on login, TOKEN_TYPE of REST_FRAMEWORK"""
+    return getattr(settings, 'REST_FRAMEWORK', {}).get('TOKEN_TYPE', 'db')
+
+
+def refresh_cached_user(user, token=None):
+    """
+    Replace user in cached credentials after the user has been changed
+    :param user: Updated user object
+    :param token: Token of current request, looked up when not passed
+    """
+    user_cache.set(user.pk, user)
+    if isinstance(token, SignedToken):
+        return
+    if not isinstance(token, Token):
+        # pylint: disable=no-member
+        token = Token.objects.filter(user=user).first()
+    if token is not None:
+        token.user = user
+        token_cache.set(token.key, (user, token))
+
+
+def invalidate_token(key, user_id=None):
+    """
+    Remove token from the caches so it can not be used anymore
+    :param key: Key of the token
+    :param user_id: Id of the owner, its token is not issued again on login
+    """
+    token_cache.delete(key)
+    if user_id is not None:
+        user_token_cache.delete(user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def evict_user(sender, instance, created=False, **kwargs):
+    """
+    Drop cached credentials of a user saved or deleted outside of the api,
+    e.g. deactivated in the admin, so they are loaded again on next use
+    """
+    # pylint: disable=unused-argument
+    if created:
+        return
+    user_cache.delete(instance.pk)
+    user_token_cache.delete(instance.pk)
+    # pylint: disable=no-member
+    for key in Token.objects.filter(user_id=instance.pk)\
+            .values_list('key', flat=True):
+        token_cache.delete(key)
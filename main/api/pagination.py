@@ -0,0 +1,27 @@
+"""
+Pagination of account application api.
+
+Lists are paginated by cursor (keyset) instead of page numbers: a page is
+fetched as ``WHERE id > <last id of the previous page> ORDER BY id LIMIT
+<page size>`` from the primary key index, so every page costs the same and
+the list is never counted.
+"""
+from rest_framework.pagination import CursorPagination, _positive_int
+
+
+class UserCursorPagination(CursorPagination):
+    """Cursor pagination of users ordered by id"""
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
@@ -1,17 +1,34 @@
 """Serializers for Accounts Application."""
 from django.contrib.auth import get_user_model, password_validation
+from django.db import IntegrityError, transaction
+from main.email_filter import email_filter
+from main.timings import timed
 from rest_framework.serializers import (
     Serializer,
     ModelSerializer,
     EmailField,
-    CharField
+    CharField,
+    ValidationError
 )
 
 # pylint: disable=invalid-name
 User = get_user_model()
 
 
-class LoginSerializer(Serializer):
+class TimedSerializerMixin(object):
+    """Adds time of validation and serialization to request timings"""
+
+    def is_valid(self, raise_exception=False):
+        with timed('serializer'):
+            return super(TimedSerializerMixin, self).is_valid(raise_exception)
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super(TimedSerializerMixin, self).data
+
+
+class LoginSerializer(TimedSerializerMixin, Serializer):
     """Login serializer
     """
     email = EmailField(
@@ -26,8 +43,12 @@ class LoginSerializer(Serializer):
     )
 
 
-class UserCreateSerializer(ModelSerializer):
+class UserCreateSerializer(TimedSerializerMixin, ModelSerializer):
     """Serializer for creating new users
+
+    Email uniqueness is not queried before the insert: the unique
+    constraint of the database rejects duplicates, also concurrent ones,
+    and the error is reported like the unique validator would.
     """
 
     # pylint: disable=too-few-public-methods
@@ -39,7 +60,8 @@ class UserCreateSerializer(ModelSerializer):
             "password"
         )
         extra_kwargs = {
-            "password": {"write_only": True}
+            "password": {"write_only": True},
+            "email": {"validators": []}
         }
 
     def validate_password(self, value):
@@ -50,21 +72,52 @@ class UserCreateSerializer(ModelSerializer):
         email = validated_data['email']
         password = validated_data['password']
 
-        # CustomPasswordValidator.validate(password=password)
-
         user_obj = User(
             email=email,
         )
 
         user_obj.set_password(password)
-        user_obj.save()
+        try:
+            insert(user_obj)
+        except IntegrityError:
+            raise ValidationError({"email": [duplicate_email_message()]})
+        email_filter.add(email)
 
         # validated_data['token'] = Token.objects.create(user=user_obj)
 
         return validated_data
 
 
-class UserInfoSerializer(ModelSerializer):
+class UserBulkCreateSerializer(UserCreateSerializer):
+    """Validates one item of bulk registration.
+
+    Email uniqueness is checked for the whole batch at once by
+    BulkRegisterView.
+    """
+
+
+def insert(user):
+    """
+    Insert new user. Inside a transaction the insert gets a savepoint, so
+    a duplicate email does not break the transaction.
+    """
+    if transaction.get_connection().in_atomic_block:
+        with transaction.atomic():
+            user.save()
+    else:
+        user.save()
+
+
+def duplicate_email_message():
+    """Same message as reported by the unique validator of email field"""
+    field = User._meta.get_field('email')
+    return field.error_messages['unique'] % {
+        'model_name': User._meta.verbose_name,
+        'field_label': field.verbose_name,
+    }
+
+
+class UserInfoSerializer(TimedSerializerMixin, ModelSerializer):
     """Serializer for User model"""
 
     # pylint: disable=too-few-public-methods
@@ -75,7 +128,19 @@ class UserInfoSerializer(ModelSerializer):
         fields = ('email', 'is_staff', 'last_name', 'first_name')
 
 
-class UserUpdateSerializer(ModelSerializer):
+class UserListSerializer(TimedSerializerMixin, ModelSerializer):
+    """Serializer for users listed to staff"""
+
+    # pylint: disable=too-few-public-methods
+    class Meta:
+        """Metaclass for User model serializer
+        """
+        model = User
+        fields = ('id', 'email', 'first_name', 'last_name', 'is_active',
+                  'is_staff', 'date_joined')
+
+
+class UserUpdateSerializer(TimedSerializerMixin, ModelSerializer):
     """Serializer for Updating User model"""
 
     password = CharField(required=False, max_length=128)
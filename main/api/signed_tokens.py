@@ -0,0 +1,145 @@
+"""
+Stateless signed api tokens.
+
+A signed token carries user id, issue time, expiry and a random token id
+(jti), signed with HMAC of SECRET_KEY. It is verified without any database
+access. Revoked token ids are stored in ``RevokedToken``; every worker keeps
+them in ``revocation_list`` and loads new rows at most once per
+``SIGNED_TOKEN['REFRESH_INTERVAL']`` seconds. Ids are not assigned in
+commit order, so a row committed after a higher id has been loaded is
+missed by incremental loads; every ``FULL_REFRESH_INTERVAL`` seconds all
+unexpired revocations are loaded again.
+"""
+import binascii
+import datetime
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from main.models import RevokedToken
+
+
+SALT = 'main.api.signed_tokens'
+
+
+def signed_token_settings():
+    """SIGNED_TOKEN settings completed with defaults"""
+    return dict({
+        'TTL': 24 * 3600,
+        'REFRESH_INTERVAL': 5,
+        'FULL_REFRESH_INTERVAL': 60,
+    }, **getattr(settings, 'SIGNED_TOKEN', {}))
+
+
+class SignedToken(object):
+    """Verified content of a signed token"""
+
+    def __init__(self, key, user_id, issued, expires, jti):
+        self.key = key
+        self.user_id = user_id
+        self.issued = issued
+        self.expires = expires
+        self.jti = jti
+
+    @classmethod
+    def issue(cls, user):
+        """Create signed token for user"""
+        issued = int(time.time())
+        payload = {
+            'uid': user.pk,
+            'iat': issued,
+            'exp': issued + signed_token_settings()['TTL'],
+            'jti': binascii.hexlify(os.urandom(8)).decode(),
+        }
+        key = signing.dumps(payload, salt=SALT, compress=True)
+        return cls(key, payload['uid'], payload['iat'], payload['exp'],
+                   payload['jti'])
+
+    @classmethod
+    def load(cls, key):
+        """
+        Verify signature of key
+        :return: SignedToken or None when key is not a valid signed token
+        """
+        try:
+            payload = signing.loads(key, salt=SALT)
+            return cls(key, payload['uid'], payload['iat'], payload['exp'],
+                       payload['jti'])
+        except (signing.BadSignature, KeyError, TypeError):
+            return None
+
+    def expired(self):
+        """Check whether the token has expired"""
+        return self.expires < time.time()
+
+
+class RevocationList(object):
+    """In-memory copy of revoked token ids"""
+
+    def __init__(self):
+        self._revoked = {}
+        self._last_id = 0
+        self._refreshed = 0
+        self._fully_refreshed = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """
+        Load revocations added since the last refresh, or all unexpired
+        revocations when the last full refresh is too old
+        """
+        now = time.time()
+        config = signed_token_settings()
+        if not force and now - self._refreshed < config['REFRESH_INTERVAL']:
+            return
+        with self._lock:
+            full = now - self._fully_refreshed >= \
+                config['FULL_REFRESH_INTERVAL']
+            if full:
+                rows = RevokedToken.objects.filter(
+                    expires__gte=datetime.datetime.fromtimestamp(
+                        now, timezone.utc))
+                revoked = {}
+            else:
+                rows = RevokedToken.objects.filter(id__gt=self._last_id)
+                revoked = self._revoked
+            for row_id, jti, expires in rows.order_by('id')\
+                    .values_list('id', 'jti', 'expires'):
+                revoked[jti] = expires.timestamp()
+                self._last_id = max(self._last_id, row_id)
+            self._revoked = {jti: expires
+                             for jti, expires in revoked.items()
+                             if expires >= now}
+            self._refreshed = now
+            if full:
+                self._fully_refreshed = now
+
+    def revoke(self, token):
+        """Revoke token in every worker"""
+        RevokedToken.objects.create(
+            jti=token.jti,
+            expires=datetime.datetime.fromtimestamp(token.expires,
+                                                    timezone.utc),
+        )
+        self._revoked[token.jti] = token.expires
+
+    def is_revoked(self, token):
+        """Check whether token has been revoked"""
+        self.refresh()
+        return token.jti in self._revoked
+
+    def reset(self):
+        """Forget every revocation, they are loaded again on next use"""
+        with self._lock:
+            self._revoked = {}
+            self._last_id = 0
+            self._refreshed = 0
+            self._fully_refreshed = 0
+
+
+# pylint: disable=invalid-name
+revocation_list = RevocationList()
@@ -0,0 +1,103 @@
+"""
+Throttling of account application api.
+
+Throttles count requests in fixed windows: for a rate ``num/period`` from
+``DEFAULT_THROTTLE_RATES`` every identity may make ``num`` requests per
+window of ``period`` seconds; further requests are rejected with 429 and
+``Retry-After`` until the next window. Rates are looked up as
+``<throttle_scope>_<ident_name>``, e.g. ``login_email`` or ``register_ip``;
+a missing rate disables the throttle.
+
+Counters are kept in ``counter_cache``, configured by ``THROTTLE_CACHE``,
+and updated with atomic ``add`` and ``incr``, so concurrent requests can
+not overshoot the limit.
+"""
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from main.cache import build_cache
+
+
+# pylint: disable=invalid-name
+counter_cache = build_cache('throttle',
+                            getattr(settings, 'THROTTLE_CACHE', None))
+
+
+class FixedWindowThrottle(BaseThrottle):
+    """Base class of fixed window throttles"""
+    ident_name = None
+
+    def __init__(self):
+        self.seconds_to_window = 0
+
+    def get_ident_value(self, request):
+        """Return value identifying the client or None to skip throttling"""
+        raise NotImplementedError('.get_ident_value() must be overridden')
+
+    def get_rate(self, view):
+        """Return (number of requests, period in seconds) or None"""
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(
+            '{}_{}'.format(scope, self.ident_name))
+        if rate is None:
+            return None
+        num, period = rate.split('/')
+        duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return int(num), duration
+
+    def allow_request(self, request, view):
+        rate = self.get_rate(view)
+        ident = self.get_ident_value(request)
+        if rate is None or ident is None:
+            return True
+
+        num, period = rate
+        now = time.time()
+        window = int(now // period)
+        key = '{}:{}:{}:{}'.format(view.throttle_scope, self.ident_name,
+                                   ident, window)
+        counter_cache.add(key, 0, timeout=period)
+        try:
+            count = counter_cache.incr(key)
+        except ValueError:
+            # The counter expired between add and incr
+            counter_cache.add(key, 1, timeout=period)
+            count = 1
+
+        if count <= num:
+            self.seconds_to_window = 0
+            return True
+        self.seconds_to_window = (window + 1) * period - now
+        return False
+
+    def wait(self):
+        return self.seconds_to_window
+
+
+class EmailRateThrottle(FixedWindowThrottle):
+    """Limits requests for the email given in request body"""
+    ident_name = 'email'
+
+    def get_ident_value(self, request):
+        data = request.data
+        if not hasattr(data, 'get'):
+            return None
+        email = data.get('email')
+        if not email or not isinstance(email, str):
+            return None
+        return email.strip().lower()
+
+
+class IPRateThrottle(FixedWindowThrottle):
+    """
+    Limits requests coming from one client address. X-Forwarded-For is
+    trusted only for NUM_PROXIES proxies of REST_FRAMEWORK settings, with
+    the default 0 clients are told apart by REMOTE_ADDR alone.
+    """
+    ident_name = 'ip'
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
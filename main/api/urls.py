@@ -2,10 +2,14 @@
 from django.conf.urls import url
 
 from .views import (
+    BulkRegisterView,
+    DeactivateView,
+    DeleteAccountView,
     LoginView,
     LogoutView,
     RegisterView,
     UserInfoView,
+    UserListView,
     UpdateUserView,
 )
 
@@ -15,8 +19,12 @@ app_name = 'api-auth'
 # pylint: disable=invalid-name
 urlpatterns = [
     url(r'^register$', RegisterView.as_view(), name='register'),
+    url(r'^register/bulk$', BulkRegisterView.as_view(), name='register-bulk'),
     url(r'^login$', LoginView.as_view(), name='login'),
     url(r'^info$', UserInfoView.as_view(), name='info'),
     url(r'^update$', UpdateUserView.as_view(), name='update'),
     url(r'^logout$', LogoutView.as_view(), name='logout'),
+    url(r'^deactivate$', DeactivateView.as_view(), name='deactivate'),
+    url(r'^delete$', DeleteAccountView.as_view(), name='delete'),
+    url(r'^users$', UserListView.as_view(), name='users'),
 ]
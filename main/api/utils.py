@@ -1,12 +1,136 @@
+import datetime
+
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.utils import timezone
+
+from main.cache import SharedCache
+from main.routers import pin_issued
+
+from .authentication import (
+    invalidate_token, token_expired, token_expiry, token_type,
+    user_token_cache,
+)
+from .signed_tokens import SignedToken
 
 User = get_user_model()
 
-def create_token(user):	
-    token, _ = Token.objects.get_or_create(user=user)
+# Inserts a token for the user or returns the existing one, which is
+# replaced when it is older than the cutoff
+UPSERT_TOKEN = """
+INSERT INTO {table} ({key}, {user_id}, {created}) VALUES (%s, %s, %s)
+ON CONFLICT ({user_id}) DO UPDATE SET
+    {key} = CASE WHEN {expired} THEN excluded.{key} ELSE {table}.{key} END,
+    {created} = CASE WHEN {expired}
+        THEN excluded.{created} ELSE {table}.{created} END
+RETURNING {key}, {user_id}, {created}
+"""
+
+
+def supports_upsert(connection):
+    """Whether INSERT ... ON CONFLICT ... RETURNING can be used"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def upsert_token(user, using):
+    """
+    Get or create token of user in one statement, an expired token is
+    replaced by a new one
+    :return: Token object
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    now = timezone.now()
+    ttl = token_expiry()['TTL']
+    params = [Token().generate_key(), user.pk,
+              connection.ops.adapt_datetimefield_value(now)]
+    if ttl is None:
+        expired = '1 = 0'
+    else:
+        expired = '{}.{} < %s'.format(quote(Token._meta.db_table),
+                                      quote('created'))
+        cutoff = connection.ops.adapt_datetimefield_value(
+            now - datetime.timedelta(seconds=ttl))
+        params.extend([cutoff, cutoff])
+    sql = UPSERT_TOKEN.format(
+        table=quote(Token._meta.db_table), key=quote('key'),
+        user_id=quote('user_id'), created=quote('created'), expired=expired)
+    # pylint: disable=no-member
+    return list(Token.objects.db_manager(using).raw(sql, params))[0]
+
+
+def create_token(user):
+    """
+    Return key of the api token of user, issuing a new one when the user
+    has none or it has expired. Tokens are remembered in user_token_cache
+    until logout, so repeated logins only check by primary key on the
+    primary that the token has not been deleted meanwhile, e.g. by logout on
+    another worker. A shared cache is cleared by logout on every worker, so
+    the check is skipped.
+    """
+    token = user_token_cache.get(user.pk)
+    # pylint: disable=no-member
+    if token is not None and not token_expired(token) and (
+            isinstance(user_token_cache, SharedCache) or
+            Token.objects.using(DEFAULT_DB_ALIAS).filter(
+                key=token.key, user_id=user.pk).exists()):
+        return token.key
+
+    using = router.db_for_write(Token)
+    if supports_upsert(connections[using]):
+        token = upsert_token(user, using)
+    else:
+        # pylint: disable=no-member
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and token_expired(token):
+            invalidate_token(token.key)
+            token.delete()
+            token = Token.objects.create(user=user)
+    user_token_cache.set(user.pk, token)
     return token.key
 
+
+def issue_token(user):
+    """
+    Issue api token of the configured type for user
+    :return: Tuple of token and keyword of Authorization header
+    """
+    if token_type() == 'signed':
+        key, keyword = SignedToken.issue(user).key, 'Bearer'
+    else:
+        key, keyword = create_token(user), 'Token'
+    pin_issued('{} {}'.format(keyword, key))
+    return key, keyword
+
+
+def user_etag(user):
+    """
+    Strong ETag of user data, it changes with every update of the user
+    :param user: User object
+    :return: Quoted ETag value
+    """
+    return '"{}-{}"'.format(user.pk, user.version)
+
+
+def parse_user_etag(value):
+    """
+    Parse ETag created by user_etag
+    :param value: Value of If-Match or If-None-Match header
+    :return: Tuple of user id and version, None when value is not an ETag
+        created by user_etag
+    """
+    try:
+        user_id, version = value.strip().strip('"').split('-')
+        return int(user_id), int(version)
+    except (AttributeError, ValueError):
+        return None
+
+
 def get_token(email='user_one@example.com'):
     test_user = User.objects.get(email=email)
-    return Token.objects.get(user_id=test_user.id).key
\ No newline at end of file
+    return Token.objects.get(user_id=test_user.id).key
@@ -1,29 +1,56 @@
 """Views for account application api"""
+from django.conf import settings
 from django.contrib import auth
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_409_CONFLICT,
+    HTTP_412_PRECONDITION_FAILED,
+)
 from rest_framework.views import APIView
 from rest_framework.generics import (
     CreateAPIView,
+    ListAPIView,
     UpdateAPIView,
 )
 from rest_framework import permissions
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 
+from main import hashing
+from main.cache import build_cache
+from main.email_filter import email_filter
 
+from .pagination import UserCursorPagination
+from .parsers import NDJSONParser
+from .throttling import EmailRateThrottle, IPRateThrottle
 from .serializers import (
+    UserBulkCreateSerializer,
     UserCreateSerializer,
     LoginSerializer,
     UserInfoSerializer,
+    UserListSerializer,
     UserUpdateSerializer,
+    duplicate_email_message,
 )
 
-from .utils import create_token
+from .authentication import invalidate_token, refresh_cached_user, user_cache
+from .signed_tokens import SignedToken, revocation_list
+from .utils import issue_token, parse_user_etag, user_etag
 
 
 User = get_user_model()
 
+# pylint: disable=invalid-name
+info_cache = build_cache('info', getattr(settings, 'INFO_CACHE', None))
+
 
 class RegisterView(CreateAPIView):
     """
@@ -36,10 +63,128 @@ class RegisterView(CreateAPIView):
         - erros in fail
     """
     serializer_class = UserCreateSerializer
+    authentication_classes = ()
     permission_classes = (permissions.AllowAny, )
+    throttle_classes = (IPRateThrottle, EmailRateThrottle)
+    throttle_scope = 'register'
     queryset = User.objects.all()
 
 
+class BulkRegisterView(APIView):
+    """
+    View for registration of many users in one request
+
+    Required:
+        token of a staff user in headers "Authorization: Token "+token
+        list of at most BULK_REGISTER['MAX_ITEMS'] objects with email and
+        password, as JSON array or as newline delimited JSON
+        (Content-Type: application/x-ndjson)
+    Returned:
+        - result for every item in the order of the request: status 201
+          and email for created users, status 400 and errors otherwise
+    """
+    # Every item costs a password hash, so anonymous clients could exhaust
+    # the hashing workers
+    permission_classes = (permissions.IsAdminUser, )
+    throttle_classes = (IPRateThrottle, )
+    throttle_scope = 'register_bulk'
+    parser_classes = (JSONParser, NDJSONParser)
+
+    def post(self, request):
+        """
+        Post method that validates every item, hashes passwords in parallel
+        and inserts users in batches
+        """
+        config = getattr(settings, 'BULK_REGISTER', {})
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {'errors': ['Expected a list of users.']},
+                HTTP_400_BAD_REQUEST
+            )
+        max_items = config.get('MAX_ITEMS', 100)
+        if len(items) > max_items:
+            return Response(
+                {'errors': ['At most {} users can be registered at '
+                            'once.'.format(max_items)]},
+                HTTP_400_BAD_REQUEST
+            )
+
+        results = []
+        batch_size = config.get('BATCH_SIZE', 100)
+        seen = set()
+        for start in range(0, len(items), batch_size):
+            results.extend(
+                self.register_batch(items[start:start + batch_size], seen))
+
+        return Response({
+            'created': sum(1 for result in results if result['status'] == 201),
+            'results': results,
+        })
+
+    @staticmethod
+    def register_batch(items, seen):
+        """
+        Register one batch of users
+        :param items: Raw items of the request
+        :param seen: Emails of previous batches, updated in place
+        :return: List of results for items
+        """
+        results = []
+        valid = []
+        for item in items:
+            serializer = UserBulkCreateSerializer(data=item)
+            if serializer.is_valid():
+                result = {'status': 201,
+                          'email': serializer.validated_data['email']}
+                valid.append((result, serializer.validated_data))
+            else:
+                result = {'status': 400, 'errors': serializer.errors}
+            results.append(result)
+
+        # Emails are unique case-insensitively among active users
+        existing = set(email.lower() for email in User.objects.filter(
+            is_active=True,
+            email__lower__in=[data['email'].lower() for _, data in valid]
+        ).values_list('email', flat=True))
+        new = []
+        for result, data in valid:
+            email = data['email'].lower()
+            if email in existing or email in seen:
+                result.update(
+                    status=400,
+                    errors={'email': [duplicate_email_message()]}
+                )
+            else:
+                seen.add(email)
+                new.append((result, data))
+
+        passwords = hashing.make_passwords(
+            [data['password'] for _, data in new])
+        users = [
+            User(email=data['email'], password=password)
+            for (_, data), password in zip(new, passwords)
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+        except IntegrityError:
+            # Some emails were registered concurrently, insert one by one
+            # to find out which of them
+            for (result, _), user in zip(new, users):
+                try:
+                    with transaction.atomic():
+                        user.save()
+                except IntegrityError:
+                    result.update(
+                        status=400,
+                        errors={'email': [duplicate_email_message()]}
+                    )
+        for user in users:
+            email_filter.add(user.email)
+        return results
+
+
 class LoginView(APIView):
     """
     Log in user view
@@ -47,12 +192,14 @@ class LoginView(APIView):
     Required:
         email and password
     Returned:
-        - message and token in success
+        - message, token and token_type (keyword of Authorization header)
+          in success
         - error in fail
     """
     authentication_classes = ()
     permission_classes = (permissions.AllowAny, )
-
+    throttle_classes = (IPRateThrottle, EmailRateThrottle)
+    throttle_scope = 'login'
 
     def post(self, request):
         """
@@ -66,13 +213,14 @@ class LoginView(APIView):
             )
 
             if user is not None:
-                token = create_token(user)
+                token, token_type = issue_token(user)
                 message = 'user {} logged'\
                     .format(serializer.validated_data['email'])
 
                 return Response({
                     'message': message,
-                    'token': token
+                    'token': token,
+                    'token_type': token_type
                 })
 
             raise AuthenticationFailed(
@@ -88,17 +236,63 @@ class LoginView(APIView):
 class UserInfoView(APIView):
     """
     Returns current user information
-    
+
     Required:
         token in headers "Authorization: Token "+token
+    Optional:
+        If-None-Match header with ETag of a previous response
+    Returned:
+        - user info and ETag header, or 304 when ETag has not changed
     """
     @staticmethod
     def get(request):
         """Request to get info of current user
+
+        The rendered body is cached per user version, so unchanged users are
+        neither serialized nor rendered again.
         """
-        serializer = UserInfoSerializer(request.user)
+        etag = user_etag(request.user)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None and (
+                if_none_match.strip() == '*' or etag in [
+                    value.strip().replace('W/', '', 1)
+                    for value in if_none_match.split(',')
+                ]):
+            response = HttpResponseNotModified()
+        else:
+            body = info_cache.get(etag)
+            if body is None:
+                body = JSONRenderer().render(
+                    UserInfoSerializer(request.user).data)
+                info_cache.set(etag, body)
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Vary'] = 'Authorization'
+        return response
+
+
+class UserListView(ListAPIView):
+    """
+    List of users for staff, ordered by id and paginated by cursor
+
+    Required:
+        token of a staff user in headers "Authorization: Token "+token
+    Optional:
+        search - prefix of email or part of first or last name
+        cursor - the position returned in next or previous link
+        page_size - number of users per page, at most 500
+    Returned:
+        - next and previous links and users of the page
+    """
+    serializer_class = UserListSerializer
+    permission_classes = (permissions.IsAdminUser,)
+    pagination_class = UserCursorPagination
 
-        return Response(serializer.data)
+    def get_queryset(self):
+        """Users matching the search parameter, only serialized columns"""
+        return User.objects.search(
+            self.request.query_params.get('search', '')
+        ).only(*UserListSerializer.Meta.fields)
 
 
 class UpdateUserView(UpdateAPIView):
@@ -109,8 +303,10 @@ class UpdateUserView(UpdateAPIView):
         token in headers "Authorization: Token "+token
     Optional:
         email, first_name, last_name, password
+        If-Match header with ETag of /info, the update fails with 412 when
+        the user has been changed since
     Returned:
-        - message in success
+        - message and ETag header in success
         - error in fail
     """
     serializer_class = UserUpdateSerializer
@@ -121,36 +317,169 @@ class UpdateUserView(UpdateAPIView):
         return obj
 
     def update(self, request, *args, **kwargs):
-        """PATCH or PUT method that will update personal data
+        """PATCH or PUT method that will update personal data.
+
+        Only changed columns are written and nothing is written when nothing
+        has changed. The UPDATE is conditional on the version of the user,
+        so concurrent updates are detected instead of overwriting each other.
         """
         # pylint: disable=attribute-defined-outside-init
         self.object = self.get_object()
         serializer = self.get_serializer(data=request.data)
 
-        if serializer.is_valid():
-            if serializer.data.get("email"):
-                self.object.email = serializer.data.get("email")
-            if serializer.data.get("first_name"):
-                self.object.first_name = serializer.data.get("first_name")
-            if serializer.data.get("last_name"):
-                self.object.last_name = serializer.data.get("last_name")
-            if serializer.data.get("password"):
-                self.object.set_password(serializer.data.get("password"))
-            self.object.save()
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+
+        expected_version = None
+        if 'HTTP_IF_MATCH' in request.META:
+            etag = parse_user_etag(request.META['HTTP_IF_MATCH'])
+            if etag is None or etag[0] != self.object.pk:
+                return Response(
+                    {"detail": "Invalid If-Match header"},
+                    status=HTTP_412_PRECONDITION_FAILED
+                )
+            expected_version = etag[1]
+
+        data = serializer.validated_data
+        password = data.get("password")
+        if password:
+            password = hashing.make_password(password)
+
+        for _ in range(2):
+            changes = self.get_changes(data)
+            if password:
+                changes["password"] = password
+            if not changes:
+                if expected_version is not None and \
+                        not User.objects.filter(
+                            pk=self.object.pk,
+                            version=expected_version).exists():
+                    return Response(
+                        {"detail": "User has been changed by another "
+                                   "request"},
+                        status=HTTP_412_PRECONDITION_FAILED
+                    )
+                break
+            version = self.object.version \
+                if expected_version is None else expected_version
+            try:
+                with transaction.atomic():
+                    updated = User.objects.filter(
+                        pk=self.object.pk,
+                        version=version
+                    ).update(version=F("version") + 1, **changes)
+            except IntegrityError:
+                return Response(
+                    {"email": [duplicate_email_message()]},
+                    status=HTTP_400_BAD_REQUEST
+                )
+            if updated:
+                info_cache.delete(user_etag(self.object))
+                for field, value in changes.items():
+                    setattr(self.object, field, value)
+                self.object.version = version + 1
+                if "email" in changes:
+                    email_filter.add(changes["email"])
+                refresh_cached_user(self.object, request.auth)
+                break
+            if expected_version is not None:
+                return Response(
+                    {"detail": "User has been changed by another request"},
+                    status=HTTP_412_PRECONDITION_FAILED
+                )
+            # The authenticated user may come from a cache and be outdated,
+            # compare with the stored one and try once more
+            self.object.refresh_from_db()
+        else:
             return Response(
-                {"detail": "Personal data is changed"},
-                status=HTTP_200_OK
+                {"detail": "User has been changed by another request"},
+                status=HTTP_409_CONFLICT
             )
 
-        return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+        response = Response(
+            {"detail": "Personal data is changed"},
+            status=HTTP_200_OK
+        )
+        response["ETag"] = user_etag(self.object)
+        return response
+
+    def get_changes(self, data):
+        """Return fields of data which differ from the current user"""
+        changes = {}
+        for field in ("email", "first_name", "last_name"):
+            value = data.get(field)
+            if value and value != getattr(self.object, field):
+                changes[field] = value
+        return changes
+
+
+class DeactivateView(APIView):
+    """
+    Deactivation of the account of current user, who is logged out
+    everywhere and can not log in anymore; the email may be registered
+    again
+
+    Required:
+        token in headers "Authorization: Token "+token
+    Returned:
+        - message in success
+        - error in fail
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    delete_account = False
+
+    def post(self, request):
+        """POST method that deactivates current user"""
+        return self.deactivate(request)
+
+    def deactivate(self, request):
+        """Deactivate current user and revoke its tokens"""
+        user = request.user
+        info_cache.delete(user_etag(user))
+        user.deactivate(delete=self.delete_account)
+        user_cache.set(user.pk, user)
+        if isinstance(request.auth, SignedToken):
+            revocation_list.revoke(request.auth)
+        # pylint: disable=no-member
+        tokens = Token.objects.filter(user=user)
+        for key in tokens.values_list('key', flat=True):
+            invalidate_token(key, user.pk)
+        tokens.delete()
+        message = 'user {} {}'.format(
+            user.email, 'deleted' if self.delete_account else 'deactivated')
+        return Response(
+            {'message': message},
+            HTTP_200_OK
+        )
+
+
+class DeleteAccountView(DeactivateView):
+    """
+    Soft deletion of the account of current user: the user is deactivated
+    and marked as deleted
+
+    Required:
+        token in headers "Authorization: Token "+token
+    Returned:
+        - message in success
+        - error in fail
+    """
+    delete_account = True
+    http_method_names = ['delete', 'options']
+
+    def delete(self, request):
+        """DELETE method that deletes account of current user"""
+        return self.deactivate(request)
 
 
 class LogoutView(APIView):
     """
     Logout user that deletes token for user
-    
+
     Required:
-        token in headers "Authorization: Token "+token
+        token in headers "Authorization: Token "+token or
+        "Authorization: Bearer "+token for signed tokens, which are revoked
     Returned:
         - message in success
         - error in fail
@@ -163,7 +492,12 @@ class LogoutView(APIView):
         """DELETE method that removes token for 
         current user from database
         """
-        request.user.auth_token.delete()
+        if isinstance(request.auth, SignedToken):
+            revocation_list.revoke(request.auth)
+        else:
+            token = request.user.auth_token
+            invalidate_token(token.key, request.user.pk)
+            token.delete()
         message = 'user {} logged out'.format(request.user.email)
         return Response(
             {'message': message},
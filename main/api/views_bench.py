@@ -0,0 +1,127 @@
+"""
+Benchmark of account application api, run with ``manage.py bench_api``.
+
+Every endpoint is driven through the Django test client against a test
+database seeded with benchmark users. For every endpoint the benchmark
+reports throughput, latency percentiles, queries per request and time spent
+hashing passwords per request.
+"""
+import random
+import time
+import uuid
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from main import hashing
+from main.bench import BENCH_EMAIL, BENCH_PASSWORD, summarize
+
+API_PREFIX = '/api/v1/auth'
+
+METRICS = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms',
+           'queries_per_request', 'hash_ms_per_request')
+
+
+class EndpointStats(object):
+    """Samples of one endpoint"""
+
+    def __init__(self):
+        self.samples = []
+        self.queries = 0
+        self.hash_seconds = 0.0
+        self.errors = 0
+
+    def call(self, func, *args, **kwargs):
+        """Call client method and record its cost"""
+        hash_seconds = hashing.metrics.hash_seconds
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = func(*args, **kwargs)
+            self.samples.append(time.perf_counter() - started)
+        self.queries += len(queries)
+        self.hash_seconds += hashing.metrics.hash_seconds - hash_seconds
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+    def summary(self):
+        """Summary of samples"""
+        result = summarize(self.samples)
+        count = len(self.samples) or 1
+        result.update(
+            queries_per_request=self.queries / count,
+            hash_ms_per_request=self.hash_seconds / count * 1000,
+            errors=self.errors,
+        )
+        return result
+
+
+def run_benchmark(users, requests):
+    """
+    Drive every endpoint ``requests`` times
+    :param users: Number of seeded users to pick credentials from
+    :param requests: Number of requests per endpoint
+    :return: Dictionary with summary of every endpoint
+    """
+    client = Client()
+    stats = {name: EndpointStats()
+             for name in ('register', 'login', 'info', 'update', 'logout')}
+    run = uuid.uuid4().hex[:8]
+
+    for i in range(requests):
+        stats['register'].call(
+            client.post, '{}/register'.format(API_PREFIX),
+            {'email': 'bench_new_{}_{}@example.com'.format(run, i),
+             'password': BENCH_PASSWORD},
+        )
+
+    tokens = []
+    for user in random.sample(range(users), min(users, requests)):
+        response = stats['login'].call(
+            client.post, '{}/login'.format(API_PREFIX),
+            {'email': BENCH_EMAIL.format(user), 'password': BENCH_PASSWORD},
+        )
+        if response.status_code == 200:
+            tokens.append('{} {}'.format(response.json()['token_type'],
+                                         response.json()['token']))
+
+    if tokens:
+        for i in range(requests):
+            stats['info'].call(
+                client.get, '{}/info'.format(API_PREFIX),
+                HTTP_AUTHORIZATION=tokens[i % len(tokens)],
+            )
+        for i in range(requests):
+            stats['update'].call(
+                client.patch, '{}/update'.format(API_PREFIX),
+                data='{{"first_name": "Bench{}"}}'.format(i),
+                content_type='application/json',
+                HTTP_AUTHORIZATION=tokens[i % len(tokens)],
+            )
+        for token in tokens:
+            stats['logout'].call(
+                client.delete, '{}/logout'.format(API_PREFIX),
+                HTTP_AUTHORIZATION=token,
+            )
+
+    return {name: endpoint.summary() for name, endpoint in stats.items()}
+
+
+def compare(base, new):
+    """
+    Compare two benchmark results
+    :return: Dictionary of endpoint -> metric -> (base, new, change in %)
+    """
+    result = {}
+    for endpoint, new_summary in new['endpoints'].items():
+        base_summary = base['endpoints'].get(endpoint)
+        if base_summary is None:
+            continue
+        result[endpoint] = {}
+        for metric in METRICS:
+            before = base_summary.get(metric, 0.0)
+            after = new_summary.get(metric, 0.0)
+            change = (after - before) / before * 100 if before else 0.0
+            result[endpoint][metric] = (before, after, change)
+    return result
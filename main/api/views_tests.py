@@ -1,6 +1,24 @@
+import datetime
 import json
+import types
 import pytest
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, hashers
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+from django.utils import timezone
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from email_auth.admin import EstimatedCountPaginator
+from main.cache import SharedCache
+from main.email_filter import email_filter
+from main.models import RevokedToken
+from . import authentication, throttling, utils
+from .authentication import token_cache
+from .serializers import UserInfoSerializer
+from .signed_tokens import SignedToken, revocation_list
 from .utils import get_token
 
 
@@ -9,6 +27,11 @@ User = get_user_model()
 API_PREFIX = '/api/v1'
 
 
+def create_staff_token():
+    staff = User.objects.create_superuser('staff@example.com', '1%abcdef1111')
+    return Token.objects.create(user=staff).key
+
+
 @pytest.mark.django_db
 def test_that_user_can_login(client):
     email = 'user_one@example.com'
@@ -119,6 +142,23 @@ def test_user_cannot_register_with_invalid_data(client):
     assert response.json()['password'] == ['This field may not be blank.']
 
 
+@pytest.mark.django_db
+def test_user_cannot_register_with_registered_email(client, budget):
+    with budget(queries=1, hashes=1):
+        response = client.post(
+            '{}/auth/register'.format(API_PREFIX),
+            {
+                "email": "user_one@example.com",
+                "password": "123abc%%%"
+            },
+        )
+
+    assert response.status_code == 400
+    assert response.json() == \
+        {'email': ['Customer with this email address already exists.']}
+    assert User.objects.filter(email='user_one@example.com').count() == 1
+
+
 @pytest.mark.django_db
 def test_user_cannot_register_wo_data(client):
     response = client.post(
@@ -220,7 +260,9 @@ def test_user_cannot_change_password_when_pass_with_letters_only(client):
     assert response.status_code == 400
     print(response.json())
     assert response.json()['password'] == \
-           ['Password must contain at least 1 digit.']
+           ['Password must contain at least 1 digit.',
+           'Password must contain at least 1 special character. List of '
+           'such characters [~!@#$%^&*()_+{}":;\'[]].']
 
 
 @pytest.mark.django_db
@@ -237,7 +279,9 @@ def test_user_cannot_change_password_when_pass_with_digits_only(client):
     assert response.status_code == 400
     print(response.json())
     assert response.json()['password'] == \
-           ['Password must contain at least 1 letter.']
+           ['Password must contain at least 1 letter.',
+           'Password must contain at least 1 special character. List of '
+           'such characters [~!@#$%^&*()_+{}":;\'[]].']
 
 
 @pytest.mark.django_db
@@ -254,7 +298,8 @@ def test_user_cannot_change_password_when_pass_with_spec_chars_only(client):
     assert response.status_code == 400
     print(response.json())
     assert response.json()['password'] == \
-           ['Password must contain at least 1 digit.']
+           ['Password must contain at least 1 digit.',
+            'Password must contain at least 1 letter.']
 
 
 @pytest.mark.django_db
@@ -286,3 +331,1026 @@ def test_user_can_change_just_email(client):
     )
     assert response.status_code == 200
     assert response.json()['detail'] == 'Personal data is changed'
+
+
+@pytest.mark.django_db
+def test_info_uses_cached_token(client):
+    token = get_token()
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    assert token_cache.get(token) is not None
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(
+            '{}/auth/info'.format(API_PREFIX),
+            HTTP_AUTHORIZATION='Token ' + token
+        )
+
+    assert response.status_code == 200
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_user_deactivated_by_save_loses_cached_token(client):
+    token = get_token()
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    user = User.objects.get(email='user_one@example.com')
+    user.is_active = False
+    user.save()
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_logout_invalidates_cached_token(client):
+    token = get_token()
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    client.delete(
+        '{}/auth/logout'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 403
+    assert response.json()['detail'] == 'Invalid token.'
+
+
+@pytest.mark.django_db
+def test_update_refreshes_cached_token(client):
+    token = get_token()
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    client.put(
+        '{}/auth/update'.format(API_PREFIX),
+        data=json.dumps({"first_name": "FirstName"}),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.json()['first_name'] == 'FirstName'
+
+
+@pytest.mark.django_db
+def test_that_user_can_login_with_email_in_other_case(client):
+    response = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'User_One@Example.com',
+        'password': 'test_123'
+    })
+
+    assert response.status_code == 200
+    assert response.json()['token'] == get_token()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('email,password,query_count', [
+    ('user_one@example.com', 'password', 1),
+    ('unknown@example.com', 'test_123', 0),
+])
+def test_that_failed_login_hashes_password_once(client, monkeypatch, email,
+                                                 password, query_count,
+                                                 shared_email_filter):
+    calls = []
+    original = hashers.PBKDF2PasswordHasher.encode
+
+    def encode(self, *args, **kwargs):
+        calls.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(hashers.PBKDF2PasswordHasher, 'encode', encode)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': email,
+            'password': password
+        })
+
+    assert response.status_code == 403
+    assert len(calls) == 1
+    assert len(queries) == query_count
+
+
+@pytest.mark.django_db
+def test_bulk_register_reports_result_per_item(client):
+    token = create_staff_token()
+    response = client.post(
+        '{}/auth/register/bulk'.format(API_PREFIX),
+        data=json.dumps([
+            {"email": "bulk_one@email.com", "password": "123abc%%%"},
+            {"email": "user_one@example.com", "password": "123abc%%%"},
+            {"email": "bulk_one@email.com", "password": "123abc%%%"},
+            {"email": "bulk_two@email.com", "password": "abcdefgh"},
+            {"email": "bulk_three@email.com", "password": "123abc%%%"},
+        ]),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert response.json()['created'] == 2
+    assert [result['status'] for result in results] == \
+           [201, 400, 400, 400, 201]
+    assert results[1]['errors']['email'] == \
+           ['Customer with this email address already exists.']
+    assert results[3]['errors']['password'][0] == \
+           'Password must contain at least 1 digit.'
+    user = User.objects.get(email='bulk_three@email.com')
+    assert user.check_password('123abc%%%')
+
+
+@pytest.mark.django_db
+def test_bulk_register_accepts_ndjson(client):
+    token = create_staff_token()
+    response = client.post(
+        '{}/auth/register/bulk'.format(API_PREFIX),
+        data='{"email": "bulk_one@email.com", "password": "123abc%%%"}\n'
+             '\n'
+             '{"email": "bulk_two@email.com", "password": "123abc%%%"}\n',
+        content_type="application/x-ndjson",
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 200
+    assert response.json()['created'] == 2
+    assert User.objects.filter(email__startswith='bulk_').count() == 2
+
+
+@pytest.mark.django_db
+def test_bulk_register_requires_a_list(client):
+    response = client.post(
+        '{}/auth/register/bulk'.format(API_PREFIX),
+        data=json.dumps({"email": "bulk_one@email.com"}),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + create_staff_token()
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_bulk_register_is_limited_to_staff(client):
+    data = json.dumps([{"email": "bulk_one@email.com",
+                        "password": "123abc%%%"}])
+
+    anonymous = client.post('{}/auth/register/bulk'.format(API_PREFIX),
+                            data=data, content_type="application/json")
+    user = client.post('{}/auth/register/bulk'.format(API_PREFIX),
+                       data=data, content_type="application/json",
+                       HTTP_AUTHORIZATION='Token ' + get_token())
+
+    assert anonymous.status_code == 403
+    assert user.status_code == 403
+    assert not User.objects.filter(email='bulk_one@email.com').exists()
+
+
+@pytest.mark.django_db
+def test_bulk_register_rejects_too_many_items(client, settings):
+    settings.BULK_REGISTER = {'MAX_ITEMS': 2, 'BATCH_SIZE': 2}
+    response = client.post(
+        '{}/auth/register/bulk'.format(API_PREFIX),
+        data=json.dumps([{"email": "bulk_{}@email.com".format(number),
+                          "password": "123abc%%%"} for number in range(3)]),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + create_staff_token()
+    )
+
+    assert response.status_code == 400
+    assert User.objects.filter(email__startswith='bulk_').count() == 0
+
+
+@pytest.fixture
+def throttle_window(monkeypatch):
+    """Keep throttled requests of a test at the start of one window"""
+    monkeypatch.setattr(throttling, 'time',
+                        types.SimpleNamespace(time=lambda: 3600.0))
+
+
+@pytest.mark.django_db
+def test_login_is_throttled_per_email_before_authentication(client,
+                                                            monkeypatch,
+                                                            throttle_window):
+    monkeypatch.setitem(api_settings.DEFAULT_THROTTLE_RATES,
+                        'login_email', '2/min')
+    for _ in range(2):
+        client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': 'user_one@example.com',
+            'password': 'password'
+        })
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': 'USER_ONE@example.com',
+            'password': 'test_123'
+        })
+
+    assert response.status_code == 429
+    assert int(response['Retry-After']) > 0
+    assert len(queries) == 0
+
+    response = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'other@example.com',
+        'password': 'password'
+    })
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_register_is_throttled_per_ip(client, monkeypatch, throttle_window):
+    monkeypatch.setitem(api_settings.DEFAULT_THROTTLE_RATES,
+                        'register_ip', '1/min')
+    client.post('{}/auth/register'.format(API_PREFIX), {})
+
+    response = client.post('{}/auth/register'.format(API_PREFIX), {})
+
+    assert response.status_code == 429
+
+
+@pytest.mark.django_db
+def test_ip_throttle_ignores_forwarded_for_header(client, monkeypatch,
+                                                  throttle_window):
+    monkeypatch.setitem(api_settings.DEFAULT_THROTTLE_RATES,
+                        'register_ip', '1/min')
+    client.post('{}/auth/register'.format(API_PREFIX), {},
+                HTTP_X_FORWARDED_FOR='10.0.0.1')
+
+    response = client.post('{}/auth/register'.format(API_PREFIX), {},
+                           HTTP_X_FORWARDED_FOR='10.0.0.2')
+
+    assert response.status_code == 429
+
+
+@pytest.mark.django_db
+def test_registered_user_can_login_after_filter_is_built(client):
+    email_filter.build()
+    client.post(
+        '{}/auth/register'.format(API_PREFIX),
+        {"email": "new_user@email.com", "password": "123abc%%%"},
+    )
+
+    response = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'new_user@email.com',
+        'password': '123abc%%%'
+    })
+
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_update_writes_only_changed_columns(client):
+    token = get_token()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.put(
+            '{}/auth/update'.format(API_PREFIX),
+            data=json.dumps({"first_name": "FirstName", "last_name": ""}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION='Token ' + token
+        )
+
+    assert response.status_code == 200
+    updates = [query['sql'] for query in queries
+               if query['sql'].startswith('UPDATE "auth_user"')]
+    assert len(updates) == 1
+    assert '"first_name"' in updates[0]
+    assert '"password"' not in updates[0]
+    assert '"email"' not in updates[0]
+    user = User.objects.get(email='user_one@example.com')
+    assert response['ETag'] == '"{}-{}"'.format(user.pk, user.version)
+
+
+@pytest.mark.django_db
+def test_update_without_changes_does_not_write(client):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.put(
+            '{}/auth/update'.format(API_PREFIX),
+            data=json.dumps({"email": "user_one@example.com"}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION='Token ' + get_token()
+        )
+
+    assert response.status_code == 200
+    assert not [query for query in queries
+                if query['sql'].startswith('UPDATE')]
+
+
+@pytest.mark.django_db
+def test_update_with_outdated_if_match_fails(client):
+    user = User.objects.get(email='user_one@example.com')
+    etag = '"{}-{}"'.format(user.pk, user.version)
+    User.objects.filter(pk=user.pk).update(version=user.version + 1)
+
+    response = client.put(
+        '{}/auth/update'.format(API_PREFIX),
+        data=json.dumps({"first_name": "FirstName"}),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + get_token(),
+        HTTP_IF_MATCH=etag
+    )
+
+    assert response.status_code == 412
+    assert User.objects.get(pk=user.pk).first_name == ''
+
+
+@pytest.mark.django_db
+def test_update_without_changes_checks_if_match(client):
+    user = User.objects.get(email='user_one@example.com')
+    etag = '"{}-{}"'.format(user.pk, user.version)
+    User.objects.filter(pk=user.pk).update(version=user.version + 1)
+
+    response = client.put(
+        '{}/auth/update'.format(API_PREFIX),
+        data=json.dumps({"email": "user_one@example.com"}),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + get_token(),
+        HTTP_IF_MATCH=etag
+    )
+
+    assert response.status_code == 412
+
+
+@pytest.mark.django_db
+def test_update_with_outdated_cached_user_succeeds(client):
+    token = get_token()
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    user = User.objects.get(email='user_one@example.com')
+    User.objects.filter(pk=user.pk).update(version=user.version + 1,
+                                           last_name='LastName')
+
+    response = client.put(
+        '{}/auth/update'.format(API_PREFIX),
+        data=json.dumps({"first_name": "FirstName"}),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 200
+    user = User.objects.get(pk=user.pk)
+    assert user.first_name == 'FirstName'
+    assert user.last_name == 'LastName'
+    assert user.version == 3
+
+
+@pytest.mark.django_db
+def test_info_answers_not_modified_for_current_etag(client):
+    token = get_token()
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    etag = response['ETag']
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(
+            '{}/auth/info'.format(API_PREFIX),
+            HTTP_AUTHORIZATION='Token ' + token,
+            HTTP_IF_NONE_MATCH=etag
+        )
+
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_info_etag_changes_after_update(client):
+    token = get_token()
+    etag = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )['ETag']
+    client.put(
+        '{}/auth/update'.format(API_PREFIX),
+        data=json.dumps({"first_name": "FirstName"}),
+        content_type="application/json",
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token,
+        HTTP_IF_NONE_MATCH=etag
+    )
+
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert response.json()['first_name'] == 'FirstName'
+
+
+@pytest.mark.django_db
+def test_info_body_is_cached_per_version(client, monkeypatch):
+    token = get_token()
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError('serializer should not be used')
+
+    monkeypatch.setattr(UserInfoSerializer, 'to_representation', fail)
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 200
+    assert response.json()['email'] == 'user_one@example.com'
+
+
+@pytest.mark.django_db
+def test_expired_token_is_rejected_and_replaced_on_login(client, settings):
+    settings.TOKEN_EXPIRY = {'TTL': 3600}
+    token = get_token()
+    Token.objects.filter(key=token).update(
+        created=timezone.now() - datetime.timedelta(hours=2))
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    assert response.status_code == 403
+    assert response.json()['detail'] == 'Token has expired.'
+
+    response = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'user_one@example.com',
+        'password': 'test_123'
+    })
+    assert response.json()['token'] != token
+    assert response.json()['token'] == get_token()
+
+
+@pytest.mark.django_db
+def test_sliding_token_is_renewed_on_use(client, settings):
+    settings.TOKEN_EXPIRY = {'TTL': 3600, 'SLIDING': True, 'RENEW_AFTER': 60}
+    token = get_token()
+    created = timezone.now() - datetime.timedelta(minutes=50)
+    Token.objects.filter(key=token).update(created=created)
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+
+    assert response.status_code == 200
+    assert Token.objects.get(key=token).created > created
+
+
+@pytest.fixture
+def signed_tokens(settings):
+    settings.REST_FRAMEWORK = dict(settings.REST_FRAMEWORK,
+                                   TOKEN_TYPE='signed')
+
+
+@pytest.mark.django_db
+def test_signed_token_authenticates_without_database(client, signed_tokens):
+    response = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'user_one@example.com',
+        'password': 'test_123'
+    })
+    assert response.json()['token_type'] == 'Bearer'
+    token = response.json()['token']
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Bearer ' + token
+    )
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(
+            '{}/auth/info'.format(API_PREFIX),
+            HTTP_AUTHORIZATION='Bearer ' + token
+        )
+
+    assert response.status_code == 200
+    assert response.json()['email'] == 'user_one@example.com'
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_signed_token_is_revoked_on_logout(client, signed_tokens):
+    token = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'user_one@example.com',
+        'password': 'test_123'
+    }).json()['token']
+
+    response = client.delete(
+        '{}/auth/logout'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Bearer ' + token
+    )
+    assert response.status_code == 200
+
+    revocation_list.reset()
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Bearer ' + token
+    )
+    assert response.status_code == 403
+    assert get_token()
+
+
+@pytest.mark.django_db
+def test_revocation_committed_out_of_id_order_is_loaded(settings):
+    settings.SIGNED_TOKEN = dict(settings.SIGNED_TOKEN, REFRESH_INTERVAL=0,
+                                 FULL_REFRESH_INTERVAL=3600)
+    token = SignedToken.issue(User.objects.get(email='user_one@example.com'))
+    revocation_list.refresh()
+    RevokedToken.objects.create(
+        jti=token.jti,
+        expires=timezone.now() + datetime.timedelta(hours=1),
+    )
+    # A higher id has been loaded before the row was committed
+    revocation_list._last_id += 100
+
+    assert not revocation_list.is_revoked(token)
+    settings.SIGNED_TOKEN['FULL_REFRESH_INTERVAL'] = 0
+    assert revocation_list.is_revoked(token)
+
+
+@pytest.mark.django_db
+def test_tampered_signed_token_is_rejected(client, signed_tokens):
+    token = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'user_one@example.com',
+        'password': 'test_123'
+    }).json()['token']
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Bearer ' + token[:-1] + (
+            'A' if token[-1] != 'A' else 'B')
+    )
+
+    assert response.status_code == 403
+    assert response.json()['detail'] == 'Invalid token.'
+
+
+@pytest.mark.django_db
+def test_api_response_has_server_timing(client):
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+
+    assert response.status_code == 200
+    timing = response['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'total;dur=' in timing
+
+
+@pytest.mark.django_db
+def test_metrics_report_histograms_per_view(client, settings):
+    settings.METRICS = {'ALLOWED_IPS': ['127.0.0.1']}
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    body = response.content.decode()
+    assert 'api_request_duration_seconds_count{view="UserInfoView"} 1' in body
+    assert 'api_queries_count{view="UserInfoView"} 1' in body
+    assert 'api_cache_hits_total{cache="token"}' in body
+    assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+def test_metrics_are_restricted_to_allowed_clients(client, settings):
+    settings.METRICS = {'ALLOWED_IPS': ['10.0.0.1'], 'TOKEN': 'secret'}
+
+    assert client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code == 200
+    assert client.get('/metrics', REMOTE_ADDR='10.0.0.2').status_code == 403
+    assert client.get('/metrics', REMOTE_ADDR='10.0.0.2',
+                      HTTP_AUTHORIZATION='Bearer wrong').status_code == 403
+    assert client.get('/metrics', REMOTE_ADDR='10.0.0.2',
+                      HTTP_AUTHORIZATION='Bearer secret').status_code == 200
+
+
+@pytest.mark.django_db
+def test_metrics_are_closed_by_default_behind_local_proxy(client, settings,
+                                                          monkeypatch):
+    monkeypatch.setattr(api_settings, 'NUM_PROXIES', 1)
+
+    assert client.get('/metrics', REMOTE_ADDR='127.0.0.1',
+                      HTTP_X_FORWARDED_FOR='203.0.113.7').status_code == 403
+
+    settings.METRICS = {'ALLOWED_IPS': ['10.0.0.1']}
+    assert client.get('/metrics', REMOTE_ADDR='127.0.0.1',
+                      HTTP_X_FORWARDED_FOR='10.0.0.1').status_code == 200
+
+
+# Queries and password hashes every endpoint may cost at most
+@pytest.mark.django_db
+@pytest.mark.parametrize('method,path,data,queries,hashes,status', [
+    ('post', 'register', {"email": "budget@email.com",
+                          "password": "123abc%%%"}, 1, 1, 201),
+    ('post', 'login', {"email": "user_one@example.com",
+                       "password": "test_123"}, 2, 1, 200),
+    ('post', 'login', {"email": "user_one@example.com",
+                       "password": "incorrect"}, 1, 1, 403),
+    ('post', 'login', {"email": "nobody@example.com",
+                       "password": "incorrect"}, 0, 1, 403),
+    ('get', 'info', None, 1, 0, 200),
+    ('patch', 'update', {"first_name": "Budget"}, 2, 0, 200),
+    ('patch', 'update', {"password": "1%abcdef1111"}, 2, 1, 200),
+    ('delete', 'logout', None, 2, 0, 200),
+])
+def test_endpoint_stays_within_budget(client, budget, shared_email_filter,
+                                      method, path, data, queries, hashes,
+                                      status):
+    token = get_token()
+    with budget(queries=queries, hashes=hashes):
+        response = getattr(client, method)(
+            '{}/auth/{}'.format(API_PREFIX, path),
+            data=json.dumps(data) if data else None,
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Token ' + token
+        )
+
+    assert response.status_code == status
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 50])
+def test_bulk_register_budget_does_not_grow_with_items(client, budget,
+                                                       count):
+    authorization = 'Token ' + create_staff_token()
+    # Resolve the token before measuring, it is cached afterwards
+    client.post('{}/auth/register/bulk'.format(API_PREFIX), data='[]',
+                content_type="application/json",
+                HTTP_AUTHORIZATION=authorization)
+    with budget(queries=2, hashes=count):
+        response = client.post(
+            '{}/auth/register/bulk'.format(API_PREFIX),
+            data=json.dumps([{"email": "bulk_{}@email.com".format(number),
+                              "password": "123abc%%%"}
+                             for number in range(count)]),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=authorization
+        )
+
+    assert response.json()['created'] == count
+
+
+@pytest.mark.django_db
+def test_budgets_hold_with_many_users(client, budget):
+    User.objects.bulk_create([
+        User(email='many_{}@email.com'.format(number),
+             username='many_{}'.format(number),
+             password=hashers.make_password(None))
+        for number in range(50)
+    ])
+    users = User.objects.filter(email__startswith='many_')
+    # pylint: disable=no-member
+    Token.objects.bulk_create([Token(user=user, key=str(user.pk).zfill(40))
+                               for user in users])
+    email_filter.build()
+    token = get_token()
+
+    with budget(queries=2, hashes=1):
+        client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': 'user_one@example.com',
+            'password': 'test_123'
+        })
+    with budget(queries=1):
+        response = client.get(
+            '{}/auth/info'.format(API_PREFIX),
+            HTTP_AUTHORIZATION='Token ' + token
+        )
+
+    assert response.status_code == 200
+    assert users.count() == 50
+
+
+@pytest.mark.django_db
+def test_login_rehashes_password_with_outdated_iterations(client, settings):
+    user = User.objects.get(email='user_one@example.com')
+    User.objects.filter(pk=user.pk).update(password=hashers.make_password(
+        'test_123', hasher='pbkdf2_sha1'))
+    settings.PASSWORD_HASHER_ITERATIONS = 1000
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': 'user_one@example.com',
+            'password': 'test_123'
+        })
+
+    assert response.status_code == 200
+    updates = [query['sql'] for query in queries
+               if query['sql'].startswith('UPDATE')]
+    assert len(updates) == 1
+    assert updates[0].startswith('UPDATE "auth_user" SET "password" = ')
+    rehashed = User.objects.get(pk=user.pk)
+    assert rehashed.password.startswith('pbkdf2_sha256$1000$')
+    assert rehashed.version == user.version
+
+
+@pytest.mark.django_db
+def test_api_only_profile_serves_api_without_sessions(client, settings):
+    from accounts import settings_api
+    settings.MIDDLEWARE = settings_api.MIDDLEWARE
+    settings.ROOT_URLCONF = settings_api.ROOT_URLCONF
+    settings.REST_FRAMEWORK = settings_api.REST_FRAMEWORK
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/json'
+    assert 'Cookie' not in response.get('Vary', '')
+
+    response = client.get('{}/auth/info'.format(API_PREFIX))
+    assert response.status_code == 403
+    assert client.get('/admin/').status_code == 404
+
+
+def test_api_only_profile_ignores_session_cookie(settings):
+    from accounts import settings_api
+    authenticator = import_string(
+        settings_api.REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'][0])
+    request = RequestFactory().get('/')
+    request.COOKIES[settings.SESSION_COOKIE_NAME] = 'session'
+
+    assert authenticator().authenticate(request) is None
+
+
+@pytest.mark.django_db
+def test_deactivated_user_cannot_log_in_and_email_is_free(client):
+    token = get_token()
+    response = client.post(
+        '{}/auth/deactivate'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    assert response.status_code == 200
+    assert not User.objects.get(email='user_one@example.com').is_active
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    assert response.status_code == 403
+    response = client.post('{}/auth/login'.format(API_PREFIX), {
+        'email': 'user_one@example.com',
+        'password': 'test_123'
+    })
+    assert response.status_code == 403
+
+    response = client.post('{}/auth/register'.format(API_PREFIX), {
+        'email': 'User_One@example.com',
+        'password': '123abc%%%'
+    })
+    assert response.status_code == 201
+    response = client.post('{}/auth/register'.format(API_PREFIX), {
+        'email': 'user_one@example.com',
+        'password': '123abc%%%'
+    })
+    assert response.status_code == 400
+    assert User.objects.get_by_natural_key('USER_ONE@example.com').email == \
+        'User_One@example.com'
+
+
+@pytest.mark.django_db
+def test_deleted_account_is_marked_as_deleted(client):
+    response = client.delete(
+        '{}/auth/delete'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+
+    assert response.status_code == 200
+    user = User.objects.get(email='user_one@example.com')
+    assert not user.is_active
+    assert user.deleted_at is not None
+    assert not Token.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_repeated_login_reuses_cached_token(client, budget):
+    def login():
+        return client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': 'user_one@example.com',
+            'password': 'test_123'
+        }).json()['token']
+
+    token = login()
+    with budget(queries=2, hashes=1) as queries:
+        assert login() == token
+    assert not any('INSERT' in query['sql'] for query in queries)
+
+    # Logout on another worker deletes the row, but not this cached token
+    Token.objects.filter(key=token).delete()
+    token = login()
+    assert Token.objects.filter(key=token).exists()
+
+    client.delete(
+        '{}/auth/logout'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    new_token = login()
+    assert new_token != token
+    assert Token.objects.get(key=new_token).created.tzinfo is not None
+
+
+@pytest.mark.django_db
+def test_repeated_login_with_shared_cache_skips_token_check(client, budget,
+                                                           monkeypatch):
+    shared = SharedCache('user-token-test')
+    monkeypatch.setattr(authentication, 'user_token_cache', shared)
+    monkeypatch.setattr(utils, 'user_token_cache', shared)
+
+    def login():
+        return client.post('{}/auth/login'.format(API_PREFIX), {
+            'email': 'user_one@example.com',
+            'password': 'test_123'
+        }).json()['token']
+
+    token = login()
+    with budget(queries=1, hashes=1):
+        assert login() == token
+
+    client.delete(
+        '{}/auth/logout'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + token
+    )
+    assert login() != token
+
+
+@pytest.mark.django_db
+def test_token_request_skips_session_authentication(client, monkeypatch):
+    def session_authenticate(self, request):
+        raise AssertionError('Session authentication should not run')
+
+    monkeypatch.setattr(SessionAuthentication, 'authenticate',
+                        session_authenticate)
+    client.force_login(User.objects.get(email='user_one@example.com'))
+
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_session_cookie_authenticates_and_is_timed_per_scheme(client,
+                                                              settings):
+    settings.METRICS = {'ALLOWED_IPS': ['127.0.0.1']}
+    client.force_login(User.objects.get(email='user_one@example.com'))
+
+    response = client.get('{}/auth/info'.format(API_PREFIX))
+    assert response.status_code == 200
+    assert response.json()['email'] == 'user_one@example.com'
+
+    client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+    body = client.get('/metrics').content.decode()
+    assert 'api_authentication_duration_seconds_count{scheme="session"} 1' \
+        in body
+    assert 'api_authentication_duration_seconds_count{scheme="token"} 1' \
+        in body
+
+
+@pytest.mark.django_db
+def test_unknown_authorization_scheme_is_not_authenticated(client):
+    response = client.get(
+        '{}/auth/info'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Basic ' + get_token()
+    )
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_staff_pages_through_users_by_cursor(client, budget):
+    User.objects.bulk_create([
+        User(email='listed_{}@example.com'.format(i)) for i in range(5)
+    ])
+    token = create_staff_token()
+    path = '{}/auth/users?page_size=3'.format(API_PREFIX)
+
+    emails = []
+    first_page = True
+    while path:
+        if first_page:
+            page = client.get(path, HTTP_AUTHORIZATION='Token ' + token)
+            first_page = False
+        else:
+            # Later pages cost the same single query on the id index
+            with budget(queries=1) as queries:
+                page = client.get(path, HTTP_AUTHORIZATION='Token ' + token)
+            assert 'OFFSET' not in queries[0]['sql']
+            assert 'COUNT' not in queries[0]['sql']
+        assert page.status_code == 200
+        emails.extend(user['email'] for user in page.json()['results'])
+        path = page.json()['next']
+
+    assert emails == list(
+        User.objects.order_by('id').values_list('email', flat=True))
+    assert 'count' not in page.json()
+
+
+@pytest.mark.django_db
+def test_staff_searches_users_by_email_prefix_and_name(client):
+    User.objects.bulk_create([
+        User(email='alice@example.com', first_name='Alice'),
+        User(email='bob@example.com', last_name='Malice'),
+        User(email='carol@example.com'),
+    ])
+    token = create_staff_token()
+
+    def search(query):
+        response = client.get(
+            '{}/auth/users'.format(API_PREFIX), {'search': query},
+            HTTP_AUTHORIZATION='Token ' + token
+        )
+        return sorted(user['email'] for user in response.json()['results'])
+
+    assert search('ALI') == ['alice@example.com', 'bob@example.com']
+    assert search('car') == ['carol@example.com']
+    assert search('example.com') == []
+
+
+@pytest.mark.django_db
+def test_users_are_listed_to_staff_only(client):
+    response = client.get(
+        '{}/auth/users'.format(API_PREFIX),
+        HTTP_AUTHORIZATION='Token ' + get_token()
+    )
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_admin_lists_users_without_full_count(client):
+    create_staff_token()
+    client.force_login(User.objects.get(email='staff@example.com'))
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get('/admin/email_auth/user/', {'q': 'user_one'})
+
+    assert response.status_code == 200
+    assert b'user_one@example.com' in response.content
+    counts = [query['sql'] for query in queries if 'COUNT' in query['sql']]
+    assert counts and all('LIMIT' in sql for sql in counts)
+
+
+@pytest.mark.django_db
+def test_admin_warns_when_more_users_match_than_are_counted(client,
+                                                            monkeypatch):
+    monkeypatch.setattr(EstimatedCountPaginator, 'max_count', 1)
+    create_staff_token()
+    client.force_login(User.objects.get(email='staff@example.com'))
+
+    response = client.get('/admin/email_auth/user/')
+
+    assert response.status_code == 200
+    assert b'More than 1 users match' in response.content
+
+
+@pytest.mark.django_db
+def test_admin_reports_duplicate_email_on_form(client):
+    create_staff_token()
+    staff = User.objects.get(email='staff@example.com')
+    client.force_login(staff)
+
+    response = client.post(
+        '/admin/email_auth/user/{}/change/'.format(staff.pk), {
+            'password': staff.password,
+            'username': 'staff',
+            'email': 'USER_ONE@example.com',
+            'is_active': 'on',
+            'is_staff': 'on',
+            'is_superuser': 'on',
+            'date_joined_0': '2017-01-01',
+            'date_joined_1': '00:00:00',
+        })
+
+    assert response.status_code == 200
+    assert response.context['adminform'].form.errors['email'] == \
+        ['Customer with this Email address already exists.']
+    assert User.objects.get(pk=staff.pk).email == 'staff@example.com'
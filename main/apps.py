@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        # Connects signal handlers evicting cached credentials
+        # pylint: disable=unused-variable
+        from main.api import authentication
@@ -0,0 +1,70 @@
+"""Helpers shared by the benchmark management commands"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+
+BENCH_EMAIL = 'bench_user_{}@example.com'
+BENCH_PASSWORD = 'bench_123%'
+
+
+def seed_users(count, batch_size=10000, stdout=None):
+    """
+    Make sure the users table holds at least ``count`` benchmark users.
+    Rows are inserted with bulk_create and a single precomputed password
+    hash, so seeding millions of users does not hash millions of times.
+    :return: Number of inserted users
+    """
+    User = get_user_model()
+    existing = User.objects.filter(email__startswith='bench_user_').count()
+    password = make_password(BENCH_PASSWORD)
+    inserted = 0
+    for start in range(existing, count, batch_size):
+        stop = min(start + batch_size, count)
+        User.objects.bulk_create(
+            User(email=BENCH_EMAIL.format(i), password=password)
+            for i in range(start, stop)
+        )
+        inserted += stop - start
+        if stdout is not None:
+            stdout.write('seeded {} users'.format(stop))
+    return inserted
+
+
+def percentile(values, fraction):
+    """Return percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(samples):
+    """
+    Summarize latency samples given in seconds
+    :return: Dictionary with throughput and latencies in milliseconds
+    """
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'throughput': len(samples) / total if total else 0.0,
+        'mean_ms': total / len(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+    }
+
+
+def measure(func, arguments):
+    """
+    Call func once for every argument
+    :return: List of call durations in seconds
+    """
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        func(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
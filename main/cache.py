@@ -0,0 +1,227 @@
+"""
+Small caches used by the authentication and api layers.
+
+Two interchangeable implementations are provided:
+
+* ``LRUCache`` keeps entries in the current process, bounded by size and
+  expired by age;
+* ``SharedCache`` stores entries in one of Django's ``CACHES`` so every
+  worker sees the same data and invalidation is visible everywhere.
+
+``build_cache`` picks one of them from a settings dictionary with the keys
+``MAX_SIZE``, ``TIMEOUT`` and ``BACKEND`` (the alias of a Django cache).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+# pylint: disable=invalid-name
+_registry = []
+
+
+class BaseCache(object):
+    """Common hit/miss bookkeeping"""
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        _registry.append(self)
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self):
+        """Return hit and miss counters of the cache"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        """Reset hit and miss counters"""
+        self.hits = 0
+        self.misses = 0
+
+
+class LRUCache(BaseCache):
+    """
+    Thread-safe in-process cache with least recently used eviction and
+    per-entry time to live.
+    """
+
+    def __init__(self, name, max_size=1024, timeout=60):
+        super(LRUCache, self).__init__(name)
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached value or None when it is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires < time.monotonic():
+                    del self._data[key]
+                    value = None
+                else:
+                    self._data.move_to_end(key)
+            else:
+                value = None
+            return self._count(value)
+
+    def set(self, key, value, timeout=None):
+        """Store value for key, evicting the least recently used entry"""
+        if timeout is None:
+            timeout = self.timeout
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, timeout=None):
+        """Store value unless key holds a live value, return whether stored"""
+        if timeout is None:
+            timeout = self.timeout
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                return False
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            return True
+
+    def incr(self, key, delta=1):
+        """
+        Atomically add delta to the value of key, keeping its expiry
+        :return: New value
+        :raises ValueError: When key is missing or expired
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                raise ValueError('Key {!r} not found'.format(key))
+            value = entry[0] + delta
+            self._data[key] = (value, entry[1])
+            return value
+
+    def delete(self, key):
+        """Remove key from the cache"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedCache(BaseCache):
+    """
+    Cache stored in one of Django's cache backends. Entries are stored with
+    the generation of the cache as key version, so clearing moves to the
+    next generation instead of clearing the whole backend, which may hold
+    entries of other caches and applications. The generation is read from
+    the backend once per process, not on every operation; clearing is meant
+    for tests and other processes keep their generation until restarted.
+    """
+
+    def __init__(self, name, backend='default', timeout=60):
+        super(SharedCache, self).__init__(name)
+        self.backend = backend
+        self.timeout = timeout
+        self._version = None
+
+    @property
+    def _cache(self):
+        return caches[self.backend]
+
+    def _key(self, key):
+        return '{}:{}'.format(self.name, key)
+
+    def _generation(self):
+        if self._version is None:
+            generation_key = self._key('generation')
+            self._cache.add(generation_key, 1, None)
+            self._version = self._cache.get(generation_key, 1)
+        return self._version
+
+    def get(self, key):
+        """Return cached value or None when it is missing"""
+        return self._count(self._cache.get(
+            self._key(key), version=self._generation()))
+
+    def set(self, key, value, timeout=None):
+        """Store value for key"""
+        if timeout is None:
+            timeout = self.timeout
+        self._cache.set(self._key(key), value, timeout,
+                        version=self._generation())
+
+    def add(self, key, value, timeout=None):
+        """Store value unless key holds a value, return whether stored"""
+        if timeout is None:
+            timeout = self.timeout
+        return self._cache.add(self._key(key), value, timeout,
+                               version=self._generation())
+
+    def incr(self, key, delta=1):
+        """
+        Atomically add delta to the value of key, when the backend supports
+        it (memcached, redis, database)
+        :raises ValueError: When key is missing
+        """
+        return self._cache.incr(self._key(key), delta,
+                                version=self._generation())
+
+    def delete(self, key):
+        """Remove key from the cache"""
+        self._cache.delete(self._key(key), version=self._generation())
+
+    def clear(self):
+        """Make every entry of this cache unreachable, they expire later"""
+        generation_key = self._key('generation')
+        try:
+            self._version = self._cache.incr(generation_key)
+        except ValueError:
+            self._version = self._generation() + 1
+            self._cache.set(generation_key, self._version, None)
+
+
+def build_cache(name, config=None):
+    """
+    Build a cache from a settings dictionary
+    :param name: Name of the cache, used as key prefix in shared backends
+    :param config: Dictionary with MAX_SIZE, TIMEOUT and BACKEND keys
+    :return: LRUCache or SharedCache instance
+    """
+    config = config or {}
+    timeout = config.get('TIMEOUT', 60)
+    if config.get('BACKEND'):
+        return SharedCache(name, backend=config['BACKEND'], timeout=timeout)
+    return LRUCache(name, max_size=config.get('MAX_SIZE', 1024),
+                    timeout=timeout)
+
+
+def clear_caches():
+    """Empty every cache built by this module and reset its counters"""
+    for cache in _registry:
+        cache.clear()
+        cache.reset_stats()
+
+
+def cache_stats():
+    """Return counters of every cache keyed by cache name"""
+    return {cache.name: cache.stats() for cache in _registry}
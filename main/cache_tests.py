@@ -0,0 +1,47 @@
+
+import pytest
+from django.core.cache import caches
+
+from main.cache import LRUCache, SharedCache
+
+
+def test_shared_cache_clear_keeps_other_keys_of_backend():
+    cache = SharedCache('clear-test')
+    cache.set('key', 'value')
+    caches['default'].set('other-application', 'kept')
+
+    cache.clear()
+
+    assert cache.get('key') is None
+    assert caches['default'].get('other-application') == 'kept'
+    cache.set('key', 'new value')
+    assert cache.get('key') == 'new value'
+    cache.delete('key')
+    assert cache.get('key') is None
+
+
+def test_lru_cache_counts_with_add_and_incr():
+    cache = LRUCache('counter-test')
+
+    assert cache.add('key', 0)
+    assert not cache.add('key', 5)
+    assert cache.incr('key') == 1
+    assert cache.incr('key', 2) == 3
+    with pytest.raises(ValueError):
+        cache.incr('missing')
+
+
+def test_shared_cache_reads_generation_once(monkeypatch):
+    cache = SharedCache('generation-test')
+    cache.set('key', 'value')
+    backend = caches['default']
+    reads = []
+    get = backend.get
+    monkeypatch.setattr(backend, 'get',
+                        lambda *args, **kwargs: reads.append(args) or
+                        get(*args, **kwargs))
+
+    assert cache.get('key') == 'value'
+    assert cache.get('missing') is None
+
+    assert len(reads) == 2
@@ -0,0 +1,113 @@
+import datetime
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+def test_import_users_from_csv(tmpdir):
+    path = tmpdir.join('users.csv')
+    path.write(
+        'email,password,password_hash,first_name,is_active\n'
+        'import_one@example.com,123abc%%%,,One,\n'
+        'import_two@example.com,,{},"Two, Second",false\n'
+        'not an email,123abc%%%,,,\n'
+        'user_one@example.com,123abc%%%,,,\n'.format(make_password('x1%abcde'))
+    )
+
+    call_command('import_users', str(path), workers=1)
+
+    one = User.objects.get(email='import_one@example.com')
+    two = User.objects.get(email='import_two@example.com')
+    assert one.check_password('123abc%%%')
+    assert one.first_name == 'One'
+    assert one.is_active
+    assert two.check_password('x1%abcde')
+    assert two.first_name == 'Two, Second'
+    assert not two.is_active
+    assert not User.objects.get(email='user_one@example.com')\
+        .check_password('123abc%%%')
+    assert not tmpdir.join('users.csv.checkpoint').exists()
+
+
+@pytest.mark.django_db
+def test_import_users_counts_malformed_records_as_invalid(tmpdir, capsys):
+    path = tmpdir.join('users.jsonl')
+    path.write(
+        '{"email": "import_one@example.com", "password": "123abc%%%"}\n'
+        '{"email": "broken\n'
+        '["import_two@example.com"]\n'
+        '{"email": 42, "password": "123abc%%%"}\n'
+        '{"email": "import_three@example.com", "password": 42}\n'
+        '{"email": "import_four@example.com", "password": "123abc%%%"}\n'
+    )
+
+    call_command('import_users', str(path), workers=1)
+
+    assert User.objects.filter(email__startswith='import_').count() == 2
+    assert '4 invalid' in capsys.readouterr()[0]
+
+
+@pytest.mark.postgresql
+@pytest.mark.django_db
+def test_import_users_copies_batches_on_postgresql(tmpdir):
+    path = tmpdir.join('users.jsonl')
+    path.write(''.join(
+        '{{"email": "import_{}@example.com", "password_hash": "{}"}}\n'
+        .format(number, make_password('x1%abcde')) for number in range(3)
+    ) + '{"email": "USER_ONE@example.com", "password": "123abc%%%"}\n')
+
+    call_command('import_users', str(path), workers=1, batch_size=2)
+
+    imported = User.objects.filter(email__startswith='import_')
+    assert imported.count() == 3
+    assert all(user.pk for user in imported)
+    assert User.objects.filter(email__iexact='user_one@example.com')\
+        .count() == 1
+
+
+@pytest.mark.django_db
+def test_import_users_resumes_from_checkpoint(tmpdir):
+    first = '{"email": "import_one@example.com", "password_hash": "%s"}\n' \
+        % make_password('x1%abcde')
+    path = tmpdir.join('users.jsonl')
+    path.write(first + '{"email": "import_two@example.com", '
+                       '"password": "123abc%%%"}\n')
+    tmpdir.join('users.jsonl.checkpoint').write(json.dumps({
+        'offset': len(first), 'imported': 1, 'skipped': 0, 'invalid': 0,
+    }))
+
+    call_command('import_users', str(path), workers=1)
+
+    assert not User.objects.filter(email='import_one@example.com').exists()
+    assert User.objects.filter(email='import_two@example.com').exists()
+
+
+@pytest.mark.django_db
+def test_purge_tokens_deletes_expired_tokens_in_batches():
+    old = timezone.now() - datetime.timedelta(days=2)
+    for i in range(5):
+        user = User.objects.create(email='purge_{}@example.com'.format(i))
+        Token.objects.create(user=user)
+    Token.objects.filter(user__email__startswith='purge_').update(created=old)
+
+    call_command('purge_tokens', ttl=24 * 3600, batch_size=2, sleep=0)
+
+    assert not Token.objects.filter(user__email__startswith='purge_').exists()
+    assert Token.objects.filter(user__email='user_one@example.com').exists()
+
+
+def test_calibrate_hasher_recommends_iterations(capsys):
+    call_command('calibrate_hasher', target_ms=1000, samples=1)
+
+    results = json.loads(capsys.readouterr()[0])['hashers']
+    assert results[0]['hasher'] == 'pbkdf2_sha256'
+    assert results[0]['recommended_iterations'] > 1000
@@ -1,28 +1,45 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.db import router
+
+from main.email_filter import email_filter
 
 
 UserModel = get_user_model()
 
 
 class CustomBackend(ModelBackend):
+    """
+    The only authentication backend of the project. Every attempt costs one
+    lookup by email and exactly one password hash: when the user does not
+    exist a dummy hash is computed so the response time does not reveal
+    whether the account exists. The lookup is skipped for emails which
+    email_filter knows are not registered. It reads from the primary: a
+    client logging in right after registering or changing the password
+    is not pinned to it yet and a lagging replica would reject it.
+    """
 
-    def authenticate(self, email=None, password=None, **kwargs):
+    def authenticate(self, request=None, email=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            user = UserModel.objects.filter(
-                email__iexact=email
-            ).distinct()
-        except UserModel.DoesNotExist:
+        if email is None:
+            # Admin login form and DRF basic authentication pass the email
+            # as username
+            email = kwargs.get(UserModel.USERNAME_FIELD, kwargs.get('username'))
+        if email is None or password is None:
             return None
 
-        if user.exists():
-            user_obj = user.first()
-            if user_obj.check_password(password):
-                return user_obj
-            return  None
-        else:
+        user_obj = None
+        if email_filter.might_exist(email):
+            user_obj = UserModel.objects.db_manager(
+                router.db_for_write(UserModel)).get_by_email(email)
+
+        if user_obj is None:
+            UserModel().set_password(password)
             return None
+        if user_obj.check_password(password) and \
+                self.user_can_authenticate(user_obj):
+            return user_obj
+        return None
 
     def get_user(self, user_id):
         UserModel = get_user_model()
@@ -0,0 +1,91 @@
+"""
+PostgreSQL backend taking connections from a ``main.db.pool`` pool.
+
+Set ``ENGINE`` to ``main.db.backends.postgresql`` and configure the pool with
+the ``POOL`` key of the database settings:
+
+* MAX_SIZE - connections per process, 0 disables pooling
+* IDLE_TIMEOUT - seconds after which idle connections are closed
+* CHECKOUT_TIMEOUT - seconds to wait for a free connection
+
+Closing the connection at the end of a request (``CONN_MAX_AGE`` 0) gives it
+back to the pool after rolling back anything left open.
+"""
+from django.db.backends.postgresql import base
+
+from main.db.pool import ConnectionPool, get_pool
+
+from .creation import DatabaseCreation
+
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'IDLE_TIMEOUT': 300,
+    'CHECKOUT_TIMEOUT': 5,
+}
+
+
+def validate(connection):
+    """Check connection is still open and answers queries"""
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except base.Database.Error:
+        return False
+    return True
+
+
+def reset(connection):
+    """Roll back transaction left open by the previous user"""
+    connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def pool_settings(self):
+        """POOL settings completed with defaults"""
+        return dict(POOL_DEFAULTS, **self.settings_dict.get('POOL') or {})
+
+    def get_pool(self, conn_params):
+        """Pool of connections opened with conn_params"""
+        config = self.pool_settings()
+        key = (self.alias, repr(sorted(conn_params.items())))
+        return get_pool(key, lambda: ConnectionPool(
+            lambda: base.Database.connect(**conn_params),
+            max_size=config['MAX_SIZE'],
+            idle_timeout=config['IDLE_TIMEOUT'],
+            checkout_timeout=config['CHECKOUT_TIMEOUT'],
+            validate=validate,
+            reset=reset,
+        ))
+
+    def get_new_connection(self, conn_params):
+        self.pool = None
+        if not self.pool_settings()['MAX_SIZE']:
+            return super(DatabaseWrapper, self).get_new_connection(
+                conn_params)
+
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.acquire()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or getattr(self, 'pool', None) is None:
+            return super(DatabaseWrapper, self)._close()
+        # Inside an atomic block Django keeps the connection object until
+        # the block ends, so it must not be handed to anybody else
+        with self.wrap_database_errors:
+            self.pool.release(self.connection, discard=self.in_atomic_block or
+                              bool(self.connection.closed))
@@ -0,0 +1,12 @@
+from django.db.backends.postgresql import creation
+
+from main.db.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would prevent dropping the database
+        close_pools()
+        super(DatabaseCreation, self)._destroy_test_db(
+            test_database_name, verbosity)
@@ -0,0 +1,162 @@
+"""
+Pool of database connections.
+
+``ConnectionPool`` is independent of the database driver: it is given
+functions to open, validate, reset and close connections. Every process has
+its own pools (see ``get_pool``), so connections are never shared between
+forked workers; inside a process a connection is checked out by one thread
+at a time.
+"""
+import os
+import threading
+import time
+
+
+class PoolExhausted(Exception):
+    """No connection became free within the checkout timeout"""
+
+
+def _close(connection):
+    connection.close()
+
+
+class ConnectionPool(object):
+    """
+    At most ``max_size`` connections, idle ones are closed after
+    ``idle_timeout`` seconds. A connection taken from the pool is validated
+    first and replaced when it is broken, e.g. after the server restarted.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, connect, max_size=10, idle_timeout=300,
+                 checkout_timeout=5, validate=None, reset=None, close=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.validate = validate or (lambda connection: True)
+        self.reset = reset or (lambda connection: None)
+        self.close = close or _close
+        self.size = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self._idle = []
+        self._condition = threading.Condition()
+
+    def _checkout(self):
+        """
+        Take the most recently used idle connection or reserve a place for
+        a new one
+        :return: Idle connection, None when a new one has to be opened
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        expired = []
+        try:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    while self._idle and \
+                            now - self._idle[0][1] > self.idle_timeout:
+                        expired.append(self._idle.pop(0)[0])
+                    if self._idle:
+                        return self._idle.pop()[0]
+                    if self.size - len(expired) < self.max_size:
+                        self.size += 1
+                        return None
+                    if now >= deadline:
+                        raise PoolExhausted(
+                            'No free connection within {} seconds'.format(
+                                self.checkout_timeout))
+                    self._condition.wait(deadline - now)
+        finally:
+            for connection in expired:
+                self.discard(connection)
+
+    def acquire(self):
+        """Return a valid connection"""
+        while True:
+            connection = self._checkout()
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    with self._condition:
+                        self.size -= 1
+                        self._condition.notify()
+                    raise
+                self.created += 1
+                return connection
+            if self.validate(connection):
+                self.reused += 1
+                return connection
+            self.discard(connection)
+
+    def release(self, connection, discard=False):
+        """Give connection back, it is closed when discard is True"""
+        if not discard:
+            try:
+                self.reset(connection)
+            except Exception:  # pylint: disable=broad-except
+                discard = True
+        if discard:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Close connection and free its place in the pool"""
+        try:
+            self.close(connection)
+        except Exception:  # pylint: disable=broad-except
+            pass
+        with self._condition:
+            self.size -= 1
+            self.discarded += 1
+            self._condition.notify()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def stats(self):
+        """Return counters as a dictionary"""
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'created': self.created,
+            'reused': self.reused,
+            'discarded': self.discarded,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """
+    Return the pool of this process stored under key, created by factory on
+    first use
+    """
+    key = (os.getpid(), key)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = factory()
+    return pool
+
+
+def close_pools():
+    """Close idle connections of every pool of this process"""
+    pid = os.getpid()
+    for (owner, _), pool in list(_pools.items()):
+        if owner == pid:
+            pool.close_all()
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from main.db.pool import ConnectionPool, PoolExhausted, get_pool
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+        self.resets = 0
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool():
+    return ConnectionPool(
+        FakeConnection, max_size=2, idle_timeout=60, checkout_timeout=0.01,
+        validate=lambda connection: not connection.closed,
+        reset=lambda connection: setattr(connection, 'resets',
+                                         connection.resets + 1),
+    )
+
+
+def test_pool_reuses_released_connection(pool):
+    connection = pool.acquire()
+    pool.release(connection)
+
+    assert pool.acquire() is connection
+    assert connection.resets == 1
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['reused'] == 1
+
+
+def test_pool_is_limited_to_max_size(pool):
+    pool.acquire()
+    pool.acquire()
+
+    with pytest.raises(PoolExhausted):
+        pool.acquire()
+
+
+def test_pool_waits_for_released_connection(pool):
+    pool.checkout_timeout = 5
+    first = pool.acquire()
+    pool.acquire()
+    threading.Timer(0.05, pool.release, [first]).start()
+
+    assert pool.acquire() is first
+
+
+def test_pool_replaces_broken_connection(pool):
+    connection = pool.acquire()
+    pool.release(connection)
+    # The server has been restarted
+    connection.closed = True
+
+    replacement = pool.acquire()
+
+    assert replacement is not connection
+    assert pool.stats()['size'] == 1
+    assert pool.stats()['discarded'] == 1
+
+
+def test_pool_closes_idle_connections(pool):
+    connection = pool.acquire()
+    pool.release(connection)
+    pool.idle_timeout = 0
+
+    assert pool.acquire() is not connection
+    assert connection.closed
+    assert pool.stats()['size'] == 1
+
+
+def test_pool_frees_place_when_connect_fails(pool):
+    def connect():
+        raise IOError('server is down')
+    pool.connect = connect
+
+    for _ in range(3):
+        with pytest.raises(IOError):
+            pool.acquire()
+    assert pool.stats()['size'] == 0
+
+
+def test_discarded_connection_is_closed(pool):
+    connection = pool.acquire()
+    pool.release(connection, discard=True)
+
+    assert connection.closed
+    assert pool.stats()['size'] == 0
+
+
+def test_get_pool_returns_pool_of_process():
+    created = []
+
+    def factory():
+        created.append(ConnectionPool(FakeConnection))
+        return created[-1]
+
+    assert get_pool('test', factory) is get_pool('test', factory)
+    assert len(created) == 1
@@ -0,0 +1,166 @@
+"""
+Probabilistic filter of registered emails.
+
+``email_filter.might_exist(email)`` answers False only for emails which are
+certainly not registered, which lets the authentication backend skip the
+database for most failed logins. The filter is a Bloom filter built from the
+users table on first use and rebuilt in a background thread every
+``REBUILD_INTERVAL`` seconds; emails registered or changed in the meantime
+are added with ``email_filter.add``.
+
+Other workers learn about new emails through ``recent_emails``, a cache
+which keeps added emails for two rebuild intervals and is consulted before
+answering False. It must be shared by every worker, otherwise a user
+registered on one worker would be rejected by another one until its next
+rebuild, so the filter is used only when ``BACKEND`` names a shared Django
+cache.
+
+Filters are built in a background thread; until the first one is ready
+every email may exist and logins are checked against the database.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from main.cache import build_cache
+
+
+def _config():
+    return dict({
+        'ENABLED': True,
+        'CAPACITY': 100000,
+        'ERROR_RATE': 0.01,
+        'REBUILD_INTERVAL': 3600,
+        'BACKEND': None,
+    }, **getattr(settings, 'EMAIL_FILTER', {}))
+
+
+def _enabled():
+    """The filter is used only with a shared cache of recent emails"""
+    config = _config()
+    return bool(config['ENABLED'] and config['BACKEND'])
+
+
+class BloomFilter(object):
+    """Bloom filter of strings sized for capacity items and error rate"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               math.log(2) ** 2))
+        self.hash_count = max(1, int(round(self.size / capacity *
+                                           math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.sha1(item.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, item):
+        """Add item to the filter"""
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class EmailFilter(object):
+    """Bloom filter of registered emails kept up to date by the api"""
+
+    def __init__(self):
+        config = _config()
+        self.recent_emails = build_cache('email-filter', {
+            'MAX_SIZE': config['CAPACITY'],
+            'TIMEOUT': config['REBUILD_INTERVAL'] * 2,
+            'BACKEND': config['BACKEND'],
+        })
+        self._filter = None
+        self._built = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._building = False
+        self._thread = None
+
+    @staticmethod
+    def normalize(email):
+        """Emails are compared case-insensitively"""
+        return email.strip().lower()
+
+    def build(self):
+        """Build the filter from every email in the users table"""
+        generation = self._generation
+        config = _config()
+        emails = get_user_model().objects.values_list('email', flat=True)
+        capacity = max(config['CAPACITY'], emails.count() * 2)
+        bloom = BloomFilter(capacity, config['ERROR_RATE'])
+        for email in emails.iterator():
+            bloom.add(self.normalize(email))
+        with self._lock:
+            # A filter built before reset may miss emails added since
+            if generation == self._generation:
+                self._filter = bloom
+                self._built = time.time()
+
+    def _build_in_background(self):
+        def build():
+            try:
+                self.build()
+            finally:
+                self._building = False
+                # The thread's connections would stay open otherwise
+                connections.close_all()
+        self._building = True
+        self._thread = threading.Thread(target=build, daemon=True)
+        self._thread.start()
+
+    def _get_filter(self):
+        if self._building:
+            return self._filter
+        if self._filter is None or \
+                time.time() - self._built > _config()['REBUILD_INTERVAL']:
+            with self._lock:
+                if not self._building:
+                    self._build_in_background()
+        return self._filter
+
+    def add(self, email):
+        """Record registered or changed email"""
+        if not email or not _enabled():
+            return
+        email = self.normalize(email)
+        self.recent_emails.set(email, True)
+        if self._filter is not None:
+            self._filter.add(email)
+
+    def might_exist(self, email):
+        """
+        Return False when email is certainly not registered, True when it may
+        be registered
+        """
+        if not _enabled():
+            return True
+        bloom = self._get_filter()
+        email = self.normalize(email)
+        if bloom is None or email in bloom:
+            return True
+        return self.recent_emails.get(email) is not None
+
+    def reset(self):
+        """Drop the filter, it is built again on next use"""
+        with self._lock:
+            self._generation += 1
+            self._filter = None
+        self.recent_emails.clear()
+
+
+# pylint: disable=invalid-name
+email_filter = EmailFilter()
@@ -0,0 +1,54 @@
+import pytest
+
+from main.email_filter import BloomFilter, email_filter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    emails = ['user_{}@example.com'.format(i) for i in range(1000)]
+    for email in emails:
+        bloom.add(email)
+
+    assert all(email in bloom for email in emails)
+    false_positives = sum('other_{}@example.com'.format(i) in bloom
+                          for i in range(1000))
+    assert false_positives < 50
+
+
+@pytest.mark.django_db
+def test_email_filter_knows_registered_and_added_emails(shared_email_filter):
+    assert email_filter.might_exist('USER_ONE@example.com')
+    assert not email_filter.might_exist('unknown@example.com')
+
+    email_filter.add('Unknown@example.com')
+
+    assert email_filter.might_exist('unknown@example.com')
+
+
+@pytest.mark.django_db
+def test_email_filter_uses_recent_emails_of_other_workers(
+        shared_email_filter):
+    email_filter.recent_emails.set('other_worker@example.com', True)
+
+    assert email_filter.might_exist('other_worker@example.com')
+
+
+def test_email_filter_is_off_without_shared_backend(settings):
+    settings.EMAIL_FILTER = dict(settings.EMAIL_FILTER, ENABLED=True,
+                                 BACKEND=None)
+
+    assert email_filter.might_exist('unknown@example.com')
+    assert email_filter._thread is None
+
+
+@pytest.mark.django_db
+def test_email_filter_is_first_built_in_background(settings):
+    settings.EMAIL_FILTER = dict(settings.EMAIL_FILTER, ENABLED=True,
+                                 BACKEND='default')
+
+    # Every email may exist until the filter is built
+    assert email_filter.might_exist('unknown@example.com')
+    email_filter._thread.join()
+
+    assert not email_filter.might_exist('unknown@example.com')
+    assert email_filter.might_exist('user_one@example.com')
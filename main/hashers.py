@@ -0,0 +1,17 @@
+"""Password hashers of account application"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 + SHA256 hasher whose iteration count is read from the
+    PASSWORD_HASHER_ITERATIONS setting, see ``manage.py calibrate_hasher``.
+    The algorithm name is kept, so existing hashes stay valid and hashes
+    with other iteration counts are upgraded on login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASHER_ITERATIONS', None) or \
+            hashers.PBKDF2PasswordHasher.iterations
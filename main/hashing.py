@@ -0,0 +1,220 @@
+"""
+Password hashing executors.
+
+Password hashing is deliberately slow and CPU bound. Instead of running it
+on the request thread, ``User.set_password`` and ``User.check_password``
+hand the work to the executor configured in ``PASSWORD_HASHING``:
+
+* ``main.hashing.InlineExecutor`` hashes in the calling thread;
+* ``main.hashing.ProcessPoolExecutor`` hashes in a pool of worker processes
+  with a bounded queue. When the queue is full for longer than
+  ``QUEUE_TIMEOUT`` seconds, ``HashingUnavailable`` is raised, which the api
+  answers with 503 instead of piling up blocked workers.
+
+Both executors record hash time and queue wait in ``metrics``.
+"""
+import concurrent.futures
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+
+from main.timings import request_timings
+
+
+class HashingUnavailable(APIException):
+    """Raised when the hashing queue is full"""
+    status_code = 503
+    default_detail = 'Password hashing is overloaded, try again later.'
+    default_code = 'hashing_unavailable'
+
+
+class HashingMetrics(object):
+    """Counters of hashing work done by the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset every counter"""
+        # pylint: disable=attribute-defined-outside-init
+        self.count = 0
+        self.rejected = 0
+        self.hash_seconds = 0.0
+        self.queue_wait_seconds = 0.0
+
+    def record(self, hash_seconds, queue_wait_seconds=0.0):
+        """Record one finished hash"""
+        with self._lock:
+            self.count += 1
+            self.hash_seconds += hash_seconds
+            self.queue_wait_seconds += queue_wait_seconds
+
+    def reject(self):
+        """Record one hash rejected because the queue was full"""
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self):
+        """Return counters as a dictionary"""
+        return {
+            'count': self.count,
+            'rejected': self.rejected,
+            'hash_seconds': self.hash_seconds,
+            'queue_wait_seconds': self.queue_wait_seconds,
+        }
+
+
+# pylint: disable=invalid-name
+metrics = HashingMetrics()
+
+
+def _run(func, args, submitted):
+    """Run hashing function and report when it started and how long it took"""
+    started = time.time()
+    result = func(*args)
+    return result, started - submitted, time.time() - started
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+class InlineExecutor(object):
+    """Hash in the calling thread"""
+
+    # pylint: disable=unused-argument
+    def __init__(self, **options):
+        pass
+
+    # pylint: disable=no-self-use
+    def run(self, func, *args):
+        """Run func with args and return its result"""
+        result, _, hash_seconds = _run(func, args, time.time())
+        metrics.record(hash_seconds)
+        request_timings.add('hash', hash_seconds)
+        return result
+
+    def map(self, func, iterable):
+        """Run func for every item of iterable"""
+        return [self.run(func, item) for item in iterable]
+
+
+class ProcessPoolExecutor(object):
+    """
+    Hash in a pool of WORKERS processes. At most QUEUE_DEPTH hashes may wait
+    for a free worker; callers wait up to QUEUE_TIMEOUT seconds for a place
+    in the queue.
+    """
+
+    def __init__(self, workers=None, queue_depth=None, queue_timeout=1.0):
+        self.workers = workers or os.cpu_count() or 1
+        if queue_depth is None:
+            queue_depth = self.workers * 4
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.workers + queue_depth)
+        self._pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+
+    def submit(self, func, *args):
+        """Queue func with args and return a future of its result"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            metrics.reject()
+            raise HashingUnavailable()
+        try:
+            future = self._pool.submit(_run, func, args, time.time())
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self._slots.release()
+        if not future.cancelled() and future.exception() is None:
+            _, queue_wait_seconds, hash_seconds = future.result()
+            metrics.record(hash_seconds, queue_wait_seconds)
+
+    @staticmethod
+    def _result(future):
+        result, _, hash_seconds = future.result()
+        request_timings.add('hash', hash_seconds)
+        return result
+
+    def run(self, func, *args):
+        """Run func with args in the pool and wait for its result"""
+        return self._result(self.submit(func, *args))
+
+    def map(self, func, iterable):
+        """Run func for every item of iterable in parallel"""
+        futures = [self.submit(func, item) for item in iterable]
+        return [self._result(future) for future in futures]
+
+    def shutdown(self):
+        """Stop worker processes"""
+        self._pool.shutdown()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the executor configured in PASSWORD_HASHING. It is created on
+    first use, so process pools are started in the process serving requests
+    and not in a parent that forks later.
+    """
+    # pylint: disable=global-statement
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = dict(getattr(settings, 'PASSWORD_HASHING', {}))
+                executor_class = import_string(
+                    config.pop('EXECUTOR', 'main.hashing.InlineExecutor'))
+                _executor = executor_class(
+                    **{key.lower(): value for key, value in config.items()})
+    return _executor
+
+
+def make_password(password):
+    """Hash password using the configured executor"""
+    if password is None:
+        return hashers.make_password(None)
+    return get_executor().run(_make_password, password)
+
+
+def make_passwords(passwords, executor=None):
+    """
+    Hash many passwords, in parallel when the executor allows it
+    :param passwords: List of raw passwords
+    :param executor: Executor to use instead of the configured one
+    """
+    return (executor or get_executor()).map(_make_password, passwords)
+
+
+def check_password(password, encoded, setter=None):
+    """
+    Check password against encoded hash using the configured executor.
+    Like ``django.contrib.auth.hashers.check_password``, setter is called
+    with the raw password when the stored hash has to be upgraded.
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    is_correct = get_executor().run(_check_password, password, encoded)
+    if is_correct and setter is not None:
+        preferred = hashers.get_hasher('default')
+        hasher = hashers.identify_hasher(encoded)
+        if hasher.algorithm != preferred.algorithm or \
+                preferred.must_update(encoded):
+            setter(password)
+    return is_correct
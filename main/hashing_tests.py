@@ -0,0 +1,64 @@
+import pytest
+from django.contrib.auth import hashers
+
+from main import hashing
+
+
+@pytest.fixture
+def pool():
+    executor = hashing.ProcessPoolExecutor(workers=1, queue_depth=1,
+                                           queue_timeout=0.01)
+    yield executor
+    executor.shutdown()
+
+
+def test_process_pool_hashes_passwords(pool):
+    encoded = pool.run(hashing._make_password, 'test_123')
+
+    assert hashers.check_password('test_123', encoded)
+    assert pool.run(hashing._check_password, 'test_123', encoded) is True
+    assert pool.run(hashing._check_password, 'wrong', encoded) is False
+    pool.queue_timeout = 5
+    assert len(pool.map(hashing._make_password, ['one', 'two', 'three'])) == 3
+
+
+def test_process_pool_rejects_when_queue_is_full(pool):
+    hashing.metrics.reset()
+    pool._slots.acquire()
+    pool._slots.acquire()
+    try:
+        with pytest.raises(hashing.HashingUnavailable):
+            pool.submit(hashing._make_password, 'test_123')
+    finally:
+        pool._slots.release()
+        pool._slots.release()
+
+    assert hashing.metrics.stats()['rejected'] == 1
+
+
+def test_metrics_record_hash_time():
+    hashing.metrics.reset()
+    hashing.make_password('test_123')
+
+    stats = hashing.metrics.stats()
+    assert stats['count'] == 1
+    assert stats['hash_seconds'] > 0
+
+
+def test_check_password_upgrades_outdated_hash():
+    encoded = hashers.make_password('test_123', hasher='pbkdf2_sha1')
+    upgraded = []
+
+    assert hashing.check_password('test_123', encoded, upgraded.append)
+    assert upgraded == ['test_123']
+
+
+def test_hasher_iterations_follow_settings(settings):
+    settings.PASSWORD_HASHER_ITERATIONS = 1000
+    encoded = hashers.make_password('test_123')
+    hasher = hashers.identify_hasher(encoded)
+
+    assert encoded.startswith('pbkdf2_sha256$1000$')
+    assert not hasher.must_update(encoded)
+    settings.PASSWORD_HASHER_ITERATIONS = 2000
+    assert hasher.must_update(encoded)
@@ -0,0 +1,71 @@
+"""Benchmark of account application api endpoints"""
+import datetime
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+
+from main.api.views_bench import compare, run_benchmark
+from main.bench import seed_users
+
+
+class Command(BaseCommand):
+    help = ('Seed a test database with users and measure throughput, '
+            'latency percentiles, queries and hashing time per request of '
+            'every api endpoint. The test database is kept between runs. '
+            'With --compare BASE NEW two stored results are compared '
+            'instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--output', help='File to write results to')
+        parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'))
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self.compare(*options['compare'])
+            return
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=options['verbosity'], keepdb=True)
+        try:
+            seed_users(options['users'], options['batch_size'],
+                       self.stdout if options['verbosity'] > 1 else None)
+            # Throttling would reject most of the benchmark requests
+            with override_settings(REST_FRAMEWORK=dict(
+                    settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={})):
+                endpoints = run_benchmark(options['users'], options['requests'])
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=options['verbosity'], keepdb=True)
+
+        result = json.dumps({
+            'meta': {
+                'date': datetime.datetime.utcnow().isoformat(),
+                'engine': connection.vendor,
+                'users': options['users'],
+                'requests': options['requests'],
+            },
+            'endpoints': endpoints,
+        }, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(result)
+        self.stdout.write(result)
+
+    def compare(self, base_path, new_path):
+        """Print changes of every metric between two results"""
+        with open(base_path) as base, open(new_path) as new:
+            changes = compare(json.load(base), json.load(new))
+        for endpoint, metrics in sorted(changes.items()):
+            self.stdout.write(endpoint)
+            for metric, (before, after, change) in sorted(metrics.items()):
+                self.stdout.write('  {:<22}{:>12.3f}{:>12.3f}{:>+9.1f}%'.format(
+                    metric, before, after, change))
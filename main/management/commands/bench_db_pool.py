@@ -0,0 +1,75 @@
+"""Benchmark of /api/v1/auth/info with and without connection pooling"""
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from rest_framework.authtoken.models import Token
+
+from main.bench import BENCH_EMAIL, seed_users, summarize
+from main.cache import clear_caches
+from main.db.pool import close_pools
+
+POOLED_ENGINE = 'main.db.backends.postgresql'
+
+
+class Command(BaseCommand):
+    help = ('Compare latency of /api/v1/auth/info when every request opens '
+            'a new database connection with latency when connections are '
+            'taken from the pool. Needs ENGINE {}; runs against a test '
+            'database, which is kept between runs.'.format(POOLED_ENGINE))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if connection.settings_dict['ENGINE'] != POOLED_ENGINE:
+            raise CommandError('ENGINE must be {}'.format(POOLED_ENGINE))
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        pool = dict(connection.settings_dict.get('POOL') or {})
+        connection.creation.create_test_db(
+            verbosity=options['verbosity'], keepdb=True)
+        try:
+            seed_users(1)
+            user = get_user_model().objects.get(email=BENCH_EMAIL.format(0))
+            # pylint: disable=no-member
+            token, _ = Token.objects.get_or_create(user=user)
+            results = {}
+            for mode, max_size in (('connect_per_request', 0),
+                                   ('pooled', pool.get('MAX_SIZE') or 10)):
+                connection.close()
+                connection.settings_dict['POOL'] = dict(pool,
+                                                        MAX_SIZE=max_size)
+                results[mode] = summarize(
+                    self.measure(token.key, options['requests']))
+        finally:
+            connection.settings_dict['POOL'] = pool
+            connection.close()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=options['verbosity'], keepdb=True)
+            close_pools()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def measure(key, requests):
+        """
+        Request /info like a fresh worker request would: caches are cleared
+        so the token is looked up in the database, and the connection is
+        closed afterwards like at the end of a request
+        :return: List of request durations in seconds
+        """
+        client = Client()
+        samples = []
+        for _ in range(requests):
+            clear_caches()
+            started = time.perf_counter()
+            client.get('/api/v1/auth/info',
+                       HTTP_AUTHORIZATION='Token {}'.format(key))
+            connection.close()
+            samples.append(time.perf_counter() - started)
+        return samples
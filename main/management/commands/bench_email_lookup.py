@@ -0,0 +1,55 @@
+"""Benchmark of user lookup by email performed on login"""
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main.bench import BENCH_EMAIL, measure, seed_users, summarize
+
+
+class Command(BaseCommand):
+    help = ('Compare the old two-query iexact email lookup with the '
+            'lower(email) index lookup on a table with many users. '
+            'Runs against a test database, which is kept between runs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--lookups', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=options['verbosity'], keepdb=True)
+        try:
+            seed_users(options['users'], options['batch_size'],
+                       self.stdout if options['verbosity'] > 1 else None)
+            emails = [
+                BENCH_EMAIL.format(random.randrange(options['users'])).upper()
+                for _ in range(options['lookups'])
+            ]
+            results = {
+                'users': options['users'],
+                'iexact_exists_first': summarize(
+                    measure(self.iexact_lookup, emails)),
+                'lower_index': summarize(measure(self.lower_lookup, emails)),
+            }
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=options['verbosity'], keepdb=True)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def iexact_lookup(email):
+        """Lookup used by CustomBackend before the lower(email) index"""
+        user = get_user_model().objects.filter(email__iexact=email).distinct()
+        if user.exists():
+            return user.first()
+        return None
+
+    @staticmethod
+    def lower_lookup(email):
+        """Lookup currently used by CustomBackend"""
+        return get_user_model().objects.get_by_email(email)
@@ -0,0 +1,106 @@
+"""Comparison of the full and the api-only settings profiles"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from rest_framework.authtoken.models import Token
+
+from main.bench import BENCH_EMAIL, seed_users, summarize
+
+PROFILES = ('accounts.settings', 'accounts.settings_api')
+
+STARTUP_SCRIPT = '''
+import time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+print(time.perf_counter() - started)
+'''
+
+
+class Command(BaseCommand):
+    help = ('Compare startup time and per-request overhead of settings '
+            'profiles {}. Every profile is measured in fresh processes; '
+            'requests run against a test database, which is kept between '
+            'runs.'.format(', '.join(PROFILES)))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--startups', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--profiles', nargs='+', default=PROFILES)
+        parser.add_argument('--requests-only', action='store_true',
+                            help='Measure requests of the current profile')
+
+    def handle(self, *args, **options):
+        if options['requests_only']:
+            self.stdout.write(json.dumps(self.measure_requests(
+                options['requests'], options['verbosity'])))
+            return
+
+        results = {}
+        for profile in options['profiles']:
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+            startups = [
+                float(subprocess.check_output(
+                    [sys.executable, '-c', STARTUP_SCRIPT], env=env))
+                for _ in range(options['startups'])
+            ]
+            output = subprocess.check_output(
+                [sys.executable, sys.argv[0], 'bench_profiles',
+                 '--requests-only', '--requests', str(options['requests'])],
+                env=env)
+            results[profile] = {
+                'startup': summarize(startups),
+                'info': json.loads(output.decode().splitlines()[-1]),
+                'apps': len(self.profile_setting(env, 'INSTALLED_APPS')),
+                'middleware': len(self.profile_setting(env, 'MIDDLEWARE')),
+            }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def profile_setting(env, name):
+        """Value of setting name in the profile of env"""
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import json; from django.conf import settings; '
+            'print(json.dumps(settings.{}))'.format(name)], env=env)
+        return json.loads(output.decode())
+
+    @staticmethod
+    def measure_requests(requests, verbosity):
+        """
+        Request /api/v1/auth/info with a cached token, so the measured time
+        is the overhead of middleware, authentication and rendering
+        :return: Summary of request durations
+        """
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, keepdb=True)
+        try:
+            seed_users(1)
+            user = get_user_model().objects.get(email=BENCH_EMAIL.format(0))
+            # pylint: disable=no-member
+            token, _ = Token.objects.get_or_create(user=user)
+            client = Client()
+            authorization = 'Token {}'.format(token.key)
+            client.get('/api/v1/auth/info', HTTP_AUTHORIZATION=authorization)
+            samples = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                client.get('/api/v1/auth/info',
+                           HTTP_AUTHORIZATION=authorization)
+                samples.append(time.perf_counter() - started)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=verbosity, keepdb=True)
+        result = summarize(samples)
+        result['profile'] = settings.SETTINGS_MODULE
+        return result
@@ -0,0 +1,89 @@
+"""Build the breached passwords file of PasswordPolicyValidator"""
+import gzip
+import heapq
+import os
+import re
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.validators import DIGEST_SIZE, password_digests
+
+SHA1_LINE = re.compile(r'^([0-9A-Fa-f]{40})(:\d+)?$')
+
+
+def read_digests(path):
+    """Yield digests of every line of the password list at path"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as source:
+        for line in source:
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if not line:
+                continue
+            match = SHA1_LINE.match(line)
+            if match:
+                yield bytes.fromhex(match.group(1))
+            else:
+                for digest in password_digests(line):
+                    yield digest
+
+
+def write_chunk(digests, directory):
+    """Write sorted unique digests to a new file in directory"""
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as chunk:
+        for digest in sorted(set(digests)):
+            chunk.write(digest)
+        return chunk.name
+
+
+def read_chunk(path):
+    """Yield digests of a chunk file"""
+    with open(path, 'rb') as chunk:
+        while True:
+            digest = chunk.read(DIGEST_SIZE)
+            if not digest:
+                return
+            yield digest
+
+
+class Command(BaseCommand):
+    help = ('Convert a list of passwords, one per line and optionally '
+            'gzipped, into the sorted digest file read by '
+            'PasswordPolicyValidator (DJANGO_BREACHED_PASSWORDS_PATH). Lines '
+            'may also be SHA1 hashes as in "HASH:COUNT" breach dumps. '
+            'Digests are sorted in chunks on disk and merged, so lists '
+            'larger than memory can be converted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source')
+        parser.add_argument('output')
+        parser.add_argument('--chunk-size', type=int, default=1000000,
+                            help='Number of digests sorted in memory at once')
+
+    def handle(self, *args, **options):
+        directory = os.path.dirname(os.path.abspath(options['output']))
+        with tempfile.TemporaryDirectory(dir=directory) as chunk_directory:
+            chunks = []
+            digests = []
+            for digest in read_digests(options['source']):
+                digests.append(digest)
+                if len(digests) >= options['chunk_size']:
+                    chunks.append(write_chunk(digests, chunk_directory))
+                    digests = []
+            if digests:
+                chunks.append(write_chunk(digests, chunk_directory))
+            if not chunks:
+                raise CommandError('No passwords found in {}'.format(
+                    options['source']))
+
+            count = 0
+            previous = None
+            with open(options['output'], 'wb') as output:
+                for digest in heapq.merge(*[read_chunk(chunk)
+                                            for chunk in chunks]):
+                    if digest != previous:
+                        output.write(digest)
+                        count += 1
+                        previous = digest
+        self.stdout.write('{} digests written to {}'.format(
+            count, options['output']))
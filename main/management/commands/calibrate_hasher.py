@@ -0,0 +1,64 @@
+"""Measure password hashers and recommend a number of iterations"""
+import json
+import math
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+
+from main.bench import BENCH_PASSWORD, measure, summarize
+
+
+class Command(BaseCommand):
+    help = ('Measure every hasher of PASSWORD_HASHERS on this host and '
+            'recommend PASSWORD_HASHER_ITERATIONS (DJANGO_HASHER_ITERATIONS) '
+            'for the target time of one hash, which is the time a login '
+            'spends hashing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100.0)
+        parser.add_argument('--samples', type=int, default=10)
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        results = []
+        for hasher in hashers.get_hashers():
+            try:
+                results.append(self.calibrate(hasher, target,
+                                              options['samples']))
+            except ValueError as error:
+                # Optional library of the hasher (argon2, bcrypt) is missing
+                results.append({'hasher': hasher.algorithm,
+                                'error': str(error)})
+        self.stdout.write(json.dumps({
+            'target_ms': options['target_ms'],
+            'hashers': results,
+        }, indent=2))
+
+    @staticmethod
+    def calibrate(hasher, target, samples):
+        """
+        Time hasher and scale its cost parameter to the target time
+        :return: Dictionary with current and recommended parameters
+        """
+        salt = hasher.salt()
+        timings = summarize(measure(
+            lambda password: hasher.encode(password, salt),
+            [BENCH_PASSWORD] * samples))
+        seconds = timings['p50_ms'] / 1000
+        result = {'hasher': hasher.algorithm, 'p50_ms': timings['p50_ms']}
+        if getattr(hasher, 'iterations', None) and seconds:
+            # PBKDF2 time is linear in the number of iterations
+            iterations = hasher.iterations * target / seconds
+            result.update(
+                iterations=hasher.iterations,
+                recommended_iterations=max(
+                    1000, int(round(iterations, -3))),
+            )
+        elif getattr(hasher, 'rounds', None) and seconds:
+            # bcrypt time doubles with every round
+            result.update(
+                rounds=hasher.rounds,
+                recommended_rounds=max(4, int(round(
+                    hasher.rounds + math.log2(target / seconds)))),
+            )
+        return result
@@ -0,0 +1,260 @@
+"""Streaming import of users from CSV or JSON lines files"""
+import csv
+import io
+import json
+import os
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+
+from main import hashing
+from main.email_filter import email_filter
+
+
+BOOLEAN_FIELDS = ('is_active', 'is_staff')
+TEXT_FIELDS = ('first_name', 'last_name')
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+
+
+def read_records(stream, file_format, offset):
+    """
+    Yield (record, offset after the record) pairs from binary stream, the
+    record is None for lines which are not valid JSON
+    :param stream: File opened in binary mode
+    :param file_format: csv or jsonl
+    :param offset: Byte offset to continue from, 0 to read from the start
+    """
+    header = None
+    if file_format == 'csv':
+        header = next(csv.reader([stream.readline().decode('utf-8')]))
+        offset = max(offset, stream.tell())
+    stream.seek(offset)
+
+    def lines():
+        while True:
+            line = stream.readline()
+            if not line:
+                return
+            yield line.decode('utf-8')
+
+    if file_format == 'csv':
+        for row in csv.reader(lines()):
+            if row:
+                yield dict(zip(header, row)), stream.tell()
+    else:
+        for line in lines():
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield record, stream.tell()
+
+
+def copy_value(value):
+    """Format value for COPY in text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t')\
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+class Command(BaseCommand):
+    help = ('Import users from a CSV or JSON lines file. Every record needs '
+            'email and either password (raw, it will be hashed) or '
+            'password_hash (a Django password string used as is); '
+            'first_name, last_name, is_active and is_staff are optional. '
+            'Existing emails are skipped. The position of the last imported '
+            'batch is stored in a checkpoint file, so an interrupted import '
+            'continues where it stopped when run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of hashing processes')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file, PATH.checkpoint by default')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore existing checkpoint')
+
+    def handle(self, *args, **options):
+        # pylint: disable=attribute-defined-outside-init
+        self.verbosity = options['verbosity']
+        path = options['path']
+        file_format = options['format'] or \
+            ('csv' if path.endswith('.csv') else 'jsonl')
+        checkpoint = options['checkpoint'] or path + '.checkpoint'
+        state = {'offset': 0, 'imported': 0, 'skipped': 0, 'invalid': 0}
+        if not options['restart'] and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                state = json.load(checkpoint_file)
+            self.stdout.write('Resuming from byte {}'.format(state['offset']))
+
+        insert = {
+            'postgresql': self.insert_postgresql,
+            'sqlite': self.insert_sqlite,
+        }.get(connection.vendor)
+        if insert is None:
+            raise CommandError(
+                'Import is not supported on {}'.format(connection.vendor))
+
+        executor = hashing.ProcessPoolExecutor(
+            workers=options['workers'],
+            queue_depth=options['batch_size'],
+            queue_timeout=None,
+        )
+        try:
+            with open(path, 'rb') as stream:
+                batch = []
+                for record, offset in read_records(
+                        stream, file_format, state['offset']):
+                    batch.append(record)
+                    if len(batch) >= options['batch_size']:
+                        self.import_batch(batch, insert, executor, state)
+                        self.save_checkpoint(checkpoint, state, offset)
+                        batch = []
+                if batch:
+                    self.import_batch(batch, insert, executor, state)
+                    self.save_checkpoint(checkpoint, state, stream.tell())
+        finally:
+            executor.shutdown()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(
+            'Imported {imported} users, skipped {skipped} existing, '
+            '{invalid} invalid'.format(**state))
+
+    def import_batch(self, records, insert, executor, state):
+        """Validate, hash and insert one batch of records"""
+        User = get_user_model()
+        users = []
+        raw_passwords = []
+        for record in records:
+            user = self.build_user(User, record)
+            if user is None:
+                state['invalid'] += 1
+                continue
+            if not user.password:
+                raw_passwords.append((user, record['password']))
+            users.append(user)
+
+        hashed = hashing.make_passwords(
+            [password for _, password in raw_passwords], executor)
+        for (user, _), password in zip(raw_passwords, hashed):
+            user.password = password
+
+        fields = [field for field in User._meta.concrete_fields
+                  if not field.primary_key]
+        rows = [
+            [field.get_db_prep_save(getattr(user, field.attname), connection)
+             for field in fields]
+            for user in users
+        ]
+        with transaction.atomic():
+            inserted = insert(User._meta.db_table,
+                              [field.column for field in fields], rows)
+        for user in users:
+            email_filter.add(user.email)
+        state['imported'] += inserted
+        state['skipped'] += len(rows) - inserted
+
+    def build_user(self, User, record):
+        """Return unsaved user for record or None when record is invalid"""
+        email = record.get('email') if isinstance(record, dict) else None
+        try:
+            if not isinstance(record, dict):
+                raise ValidationError('record is not an object')
+            if not isinstance(email, str):
+                raise ValidationError('email is missing')
+            email = email.strip()
+            validate_email(email)
+            password_hash = record.get('password_hash')
+            if password_hash:
+                if not isinstance(password_hash, str):
+                    raise ValidationError('password_hash is not a string')
+                identify_hasher(password_hash)
+            elif not record.get('password') or \
+                    not isinstance(record['password'], str):
+                raise ValidationError('password is missing')
+        except (ValidationError, ValueError) as exc:
+            if self.verbosity > 1:
+                self.stderr.write('Invalid record {}: {}'.format(email, exc))
+            return None
+
+        user = User(email=User.objects.normalize_email(email),
+                    password=password_hash or '')
+        for name in TEXT_FIELDS:
+            setattr(user, name, record.get(name) or '')
+        for name in BOOLEAN_FIELDS:
+            value = record.get(name)
+            if value not in (None, ''):
+                setattr(user, name, str(value).lower() in TRUE_VALUES)
+        return user
+
+    @staticmethod
+    def insert_postgresql(table, columns, rows):
+        """
+        COPY rows into a temporary table and move them to the users table,
+        skipping rows which conflict with existing users
+        :return: Number of inserted rows
+        """
+        column_list = ', '.join(connection.ops.quote_name(column)
+                                for column in columns)
+        data = io.StringIO()
+        for row in rows:
+            data.write('\t'.join(copy_value(value) for value in row))
+            data.write('\n')
+        data.seek(0)
+        with connection.cursor() as cursor:
+            # Only the imported columns: the stage would copy NOT NULL of id
+            # but not its sequence default
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS import_users_stage '
+                'ON COMMIT DELETE ROWS AS SELECT {columns} FROM {table} '
+                'WITH NO DATA'.format(table=table, columns=column_list))
+            cursor.cursor.copy_expert(
+                'COPY import_users_stage ({}) FROM STDIN'.format(column_list),
+                data)
+            cursor.execute(
+                'INSERT INTO {table} ({columns}) '
+                'SELECT {columns} FROM import_users_stage '
+                'ON CONFLICT DO NOTHING'.format(
+                    table=table, columns=column_list))
+            return cursor.rowcount
+
+    @staticmethod
+    def insert_sqlite(table, columns, rows):
+        """
+        Insert rows with executemany, skipping rows which conflict with
+        existing users
+        :return: Number of inserted rows
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT total_changes()')
+            before = cursor.fetchone()[0]
+            cursor.executemany(
+                'INSERT OR IGNORE INTO {} ({}) VALUES ({})'.format(
+                    table,
+                    ', '.join(connection.ops.quote_name(column)
+                              for column in columns),
+                    ', '.join(['%s'] * len(columns))),
+                rows)
+            cursor.execute('SELECT total_changes()')
+            return cursor.fetchone()[0] - before
+
+    @staticmethod
+    def save_checkpoint(checkpoint, state, offset):
+        """Atomically store position of the last imported record"""
+        state['offset'] = offset
+        with open(checkpoint + '.tmp', 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+        os.replace(checkpoint + '.tmp', checkpoint)
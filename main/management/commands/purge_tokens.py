@@ -0,0 +1,74 @@
+"""Deletion of expired api tokens"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from main.api.authentication import invalidate_token, token_expiry
+from main.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = ('Delete tokens older than TOKEN_EXPIRY TTL and revocations of '
+            'expired signed tokens. Rows are deleted in small batches with a '
+            'pause between them, so the table is never locked for long and '
+            'replicas can keep up.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to wait between batches')
+        parser.add_argument('--ttl', type=int,
+                            help='Age in seconds, TOKEN_EXPIRY TTL by default')
+
+    def handle(self, *args, **options):
+        ttl = options['ttl'] or token_expiry()['TTL']
+        if ttl is None:
+            raise CommandError('Tokens do not expire, set TOKEN_EXPIRY TTL '
+                               'or pass --ttl')
+        now = timezone.now()
+
+        # pylint: disable=no-member
+        deleted = self.purge(
+            Token.objects.filter(
+                created__lt=now - datetime.timedelta(seconds=ttl)
+            ).order_by('created'),
+            options,
+            invalidate_token,
+        )
+        self.stdout.write('Deleted {} expired tokens'.format(deleted))
+
+        deleted = self.purge(
+            RevokedToken.objects.filter(expires__lt=now).order_by('expires'),
+            options,
+        )
+        self.stdout.write('Deleted {} expired revocations'.format(deleted))
+
+    def purge(self, queryset, options, callback=None):
+        """
+        Delete rows of queryset in batches
+        :param callback: Function called with primary key of deleted rows
+        :return: Number of deleted rows
+        """
+        deleted = 0
+        while True:
+            keys = list(queryset.values_list('pk', flat=True)
+                        [:options['batch_size']])
+            if not keys:
+                break
+            # The filter of queryset is checked again, rows which stopped
+            # matching since they were selected (e.g. tokens renewed by
+            # login) are kept
+            count, _ = queryset.filter(pk__in=keys).delete()
+            if callback is not None:
+                for key in keys:
+                    callback(key)
+            deleted += count
+            if options['verbosity'] > 1:
+                self.stdout.write('Deleted {} rows'.format(deleted))
+            if len(keys) < options['batch_size']:
+                break
+            time.sleep(options['sleep'])
+        return deleted
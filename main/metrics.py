@@ -0,0 +1,210 @@
+"""
+Performance metrics of the api.
+
+``PerformanceMiddleware`` (see ``main.middleware``) resets
+``request_timings`` at the start of every request; database cursors,
+hashing executors and serializers add their time to it. At the end of a
+request to the api the timings are observed by fixed-bucket histograms per
+view, which ``metrics_view`` serves in Prometheus text format to the
+clients allowed by ``METRICS`` settings.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.throttling import BaseThrottle
+
+from main import hashing
+from main.cache import cache_stats
+from main.timings import request_timings
+
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+HISTOGRAMS = (
+    ('request_duration_seconds', 'total', TIME_BUCKETS),
+    ('db_duration_seconds', 'db', TIME_BUCKETS),
+    ('hash_duration_seconds', 'hash', TIME_BUCKETS),
+    ('serializer_duration_seconds', 'serializer', TIME_BUCKETS),
+    ('queries', 'queries', QUERY_BUCKETS),
+)
+
+
+class Histogram(object):
+    """Histogram with fixed buckets"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Count value in its bucket"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        """Return lines of Prometheus text format"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, self.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return lines
+
+
+class MetricsRegistry(object):
+    """Histograms of every metric, keyed by metric name and label"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, label, value, buckets=TIME_BUCKETS,
+                label_name='view'):
+        """Observe value of metric name with label"""
+        key = (name, label_name, label)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe_request(self, view, total):
+        """Observe timings of the finished request handled by view"""
+        for name, timing, buckets in HISTOGRAMS:
+            value = total if timing == 'total' \
+                else getattr(request_timings, timing)
+            self.observe(name, view, value, buckets)
+
+    def render(self):
+        """Return every histogram in Prometheus text format"""
+        lines = []
+        with self._lock:
+            names = sorted(set(key[0] for key in self._histograms))
+            for name in names:
+                metric = 'api_{}'.format(name)
+                lines.append('# TYPE {} histogram'.format(metric))
+                for (histogram_name, label_name, label), histogram in sorted(
+                        self._histograms.items()):
+                    if histogram_name == name:
+                        lines.extend(histogram.render(
+                            metric, '{}="{}"'.format(label_name, label)))
+        return lines
+
+    def reset(self):
+        """Drop every histogram"""
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class TimedCursorMixin(object):
+    """Adds duration of queries to request_timings"""
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return super(TimedCursorMixin, self).execute(sql, params)
+        finally:
+            request_timings.queries += 1
+            request_timings.db += time.perf_counter() - started
+
+    def executemany(self, sql, param_list):
+        started = time.perf_counter()
+        try:
+            return super(TimedCursorMixin, self).executemany(sql, param_list)
+        finally:
+            request_timings.queries += 1
+            request_timings.db += time.perf_counter() - started
+
+
+class TimedCursorWrapper(TimedCursorMixin, CursorWrapper):
+    """Cursor wrapper measuring queries"""
+
+
+class TimedCursorDebugWrapper(TimedCursorMixin, CursorDebugWrapper):
+    """Debug cursor wrapper measuring queries"""
+
+
+def instrument_connection(connection):
+    """Make connection create cursors which measure queries"""
+    if getattr(connection, 'instrumented', False):
+        return
+    connection.make_cursor = lambda cursor: \
+        TimedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: \
+        TimedCursorDebugWrapper(cursor, connection)
+    connection.instrumented = True
+
+
+def server_timing(total):
+    """Value of Server-Timing header for the current request"""
+    timings = request_timings
+    return ('db;dur={:.3f};desc="{} queries", hash;dur={:.3f}, '
+            'serializer;dur={:.3f}, total;dur={:.3f}').format(
+                timings.db * 1000, timings.queries, timings.hash * 1000,
+                timings.serializer * 1000, total * 1000)
+
+
+def metrics_allowed(request):
+    """
+    Check whether request may read metrics: it comes from one of
+    METRICS['ALLOWED_IPS'], carries "Authorization: Bearer <METRICS['TOKEN']>"
+    or is made by a staff user logged in to the admin. The client address is
+    taken from X-Forwarded-For behind NUM_PROXIES proxies, like IPRateThrottle
+    does, so a proxy on the same host does not open metrics to everyone.
+    """
+    config = getattr(settings, 'METRICS', {})
+    if BaseThrottle().get_ident(request) in config.get('ALLOWED_IPS', ()):
+        return True
+    token = config.get('TOKEN')
+    if token and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''),
+            'Bearer {}'.format(token)):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def metrics_view(request):
+    """Serve metrics in Prometheus text format"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    lines = registry.render()
+
+    hashing_stats = hashing.metrics.stats()
+    lines.append('# TYPE api_hashes_total counter')
+    lines.append('api_hashes_total {}'.format(hashing_stats['count']))
+    lines.append('# TYPE api_hashes_rejected_total counter')
+    lines.append('api_hashes_rejected_total {}'.format(
+        hashing_stats['rejected']))
+    lines.append('# TYPE api_hash_seconds_total counter')
+    lines.append('api_hash_seconds_total {}'.format(
+        hashing_stats['hash_seconds']))
+    lines.append('# TYPE api_hash_queue_wait_seconds_total counter')
+    lines.append('api_hash_queue_wait_seconds_total {}'.format(
+        hashing_stats['queue_wait_seconds']))
+
+    stats = sorted(cache_stats().items())
+    for counter in ('hits', 'misses'):
+        lines.append('# TYPE api_cache_{}_total counter'.format(counter))
+        for name, values in stats:
+            lines.append('api_cache_{}_total{{cache="{}"}} {}'.format(
+                counter, name, values[counter]))
+
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,78 @@
+"""Middleware of account application"""
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from main.metrics import instrument_connection, registry, server_timing
+from main.routers import (
+    client_keys, credential_key, replica_aliases, routing_state,
+    sticky_clients,
+)
+from main.timings import request_timings
+
+
+API_APP_NAME = 'api-auth'
+
+
+class PerformanceMiddleware(object):
+    """
+    Measures requests to the api: query count, database time, password
+    hashing time, serializer time and total latency are sent in the
+    Server-Timing header and observed by histograms per view, see
+    main.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for connection in connections.all():
+            instrument_connection(connection)
+        request_timings.reset()
+        started = time.perf_counter()
+
+        response = self.get_response(request)
+
+        match = request.resolver_match
+        if match is not None and API_APP_NAME in match.app_names:
+            total = time.perf_counter() - started
+            view = getattr(match.func, 'view_class', match.func).__name__
+            registry.observe_request(view, total)
+            response['Server-Timing'] = server_timing(total)
+        return response
+
+
+class ReplicaStickinessMiddleware(object):
+    """
+    Pins clients which wrote recently to the primary database, see
+    main.routers
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        routing = getattr(settings, 'REPLICA_ROUTING', {})
+        if replica_aliases() and not routing.get('BACKEND'):
+            # Pins kept by one worker would not be seen by the others
+            raise ImproperlyConfigured(
+                "REPLICA_ROUTING['BACKEND'] must be a cache alias shared by "
+                "every worker when replicas are configured")
+
+    def __call__(self, request):
+        routing_state.reset()
+        if not replica_aliases():
+            return self.get_response(request)
+
+        keys = client_keys(request)
+        routing_state.pinned = any(sticky_clients.get(key) for key in keys)
+        response = self.get_response(request)
+        if routing_state.wrote:
+            keys.extend(credential_key('auth', authorization)
+                        for authorization in routing_state.issued)
+            session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+            if session is not None and session.value:
+                keys.append(credential_key('session', session.value))
+            for key in keys:
+                sticky_clients.set(key, True)
+        return response
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+INDEX_NAME = 'authtoken_token_created'
+
+CREATE_INDEX = {
+    'postgresql': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                  'ON authtoken_token (created)',
+    'sqlite': 'CREATE INDEX IF NOT EXISTS {name} ON authtoken_token (created)',
+}
+
+DROP_INDEX = {
+    'postgresql': 'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+    'sqlite': 'DROP INDEX IF EXISTS {name}',
+}
+
+
+# Whether index is valid; CREATE INDEX CONCURRENTLY leaves an invalid index
+# behind when it fails or is cancelled
+INDEX_VALID = ('SELECT indisvalid FROM pg_index '
+               'WHERE indexrelid = to_regclass(%s)')
+
+
+def index_valid(schema_editor, name):
+    """Whether index name is valid, None when it does not exist"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(INDEX_VALID, [name])
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_INDEX:
+        return
+    if vendor == 'postgresql' and \
+            index_valid(schema_editor, INDEX_NAME) is False:
+        # Left behind by a failed run, IF NOT EXISTS would keep it
+        schema_editor.execute(DROP_INDEX[vendor].format(name=INDEX_NAME))
+    schema_editor.execute(CREATE_INDEX[vendor].format(name=INDEX_NAME))
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in DROP_INDEX:
+        return
+    schema_editor.execute(DROP_INDEX[vendor].format(name=INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+    """Index used by purge_tokens to find expired tokens"""
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,16 @@
+"""Models of account application"""
+from django.db import models
+
+
+class RevokedToken(models.Model):
+    """
+    Signed api token revoked before its expiry. Rows are only appended, so
+    workers can load new revocations incrementally by id, and reload all of
+    them from time to time for rows committed out of id order; expired rows
+    are removed by purge_tokens.
+    """
+    jti = models.CharField(max_length=32, unique=True)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
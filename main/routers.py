@@ -0,0 +1,121 @@
+"""
+Routing of users and tokens between the primary database and read replicas.
+
+Reads of ``email_auth`` and ``authtoken`` models go to a random replica
+from ``REPLICA_ROUTING['ALIASES']``, writes and reads inside transactions go
+to the primary. Once a thread has written, its reads stay on the primary.
+
+``ReplicaStickinessMiddleware`` (see ``main.middleware``) extends this over
+requests: a client that
+wrote is pinned to the primary for ``STICKY_SECONDS``, so ``/info`` right
+after ``/update`` or ``/login`` never reads from a lagging replica. Clients
+are recognized by their credentials, the Authorization header or session
+cookie, and credentials issued by login are pinned together with them.
+Addresses are not used, clients behind one proxy would pin each other.
+Pins are kept in ``sticky_clients``, which must be shared by every worker:
+the middleware requires its ``BACKEND`` when replicas are configured.
+"""
+import hashlib
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from main.cache import build_cache
+
+
+ROUTED_APPS = ('email_auth', 'authtoken')
+
+
+def _config():
+    return dict({
+        'ALIASES': [],
+        'STICKY_SECONDS': 5,
+        'MAX_SIZE': 100000,
+        'BACKEND': None,
+    }, **getattr(settings, 'REPLICA_ROUTING', {}))
+
+
+def replica_aliases():
+    """Aliases of DATABASES holding replicas"""
+    return _config()['ALIASES']
+
+
+class RoutingState(threading.local):
+    """Routing state of the current thread"""
+
+    def __init__(self):
+        super(RoutingState, self).__init__()
+        self.reset()
+
+    def reset(self):
+        """Forget writes, called at the start of every request"""
+        # pylint: disable=attribute-defined-outside-init
+        self.pinned = False
+        self.wrote = False
+        self.issued = []
+
+
+# pylint: disable=invalid-name
+routing_state = RoutingState()
+sticky_clients = build_cache('replica-sticky', {
+    'MAX_SIZE': _config()['MAX_SIZE'],
+    'TIMEOUT': _config()['STICKY_SECONDS'],
+    'BACKEND': _config()['BACKEND'],
+})
+
+
+class ReplicaRouter(object):
+    """Database router of users and tokens, see module documentation"""
+
+    # pylint: disable=no-self-use,unused-argument,protected-access
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS:
+            return None
+        replicas = replica_aliases()
+        if not replicas or routing_state.pinned or routing_state.wrote or \
+                connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS:
+            return None
+        routing_state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
+
+
+def credential_key(kind, value):
+    """Key of credential value in sticky_clients"""
+    return '{}:{}'.format(kind, hashlib.sha1(value.encode('utf-8')).hexdigest())
+
+
+def client_keys(request):
+    """Keys identifying the client of request in sticky_clients"""
+    keys = []
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        keys.append(credential_key('auth', authorization))
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        keys.append(credential_key('session', session))
+    return keys
+
+
+def pin_issued(authorization):
+    """
+    Pin credentials issued to the client of the current request, e.g. the
+    api token returned by login, together with the client
+    :param authorization: Value of Authorization header using them
+    """
+    routing_state.issued.append(authorization)
@@ -0,0 +1,142 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.models import Group
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from main.custom_user_backend import CustomBackend
+from main.middleware import ReplicaStickinessMiddleware
+from main.routers import ReplicaRouter, pin_issued, routing_state
+
+
+User = get_user_model()
+
+
+# pylint: disable=redefined-outer-name,unused-argument
+@pytest.fixture
+def replicas(settings):
+    settings.REPLICA_ROUTING = {'ALIASES': ['replica_0'],
+                                'STICKY_SECONDS': 60, 'BACKEND': 'default'}
+    routing_state.reset()
+    yield
+    routing_state.reset()
+
+
+def test_reads_of_users_and_tokens_go_to_replicas(replicas):
+    router = ReplicaRouter()
+
+    assert router.db_for_read(User) == 'replica_0'
+    assert router.db_for_read(Token) == 'replica_0'
+    assert router.db_for_read(Group) is None
+
+
+def test_reads_go_to_primary_without_replicas(settings):
+    settings.REPLICA_ROUTING = {'ALIASES': []}
+
+    assert ReplicaRouter().db_for_read(User) == 'default'
+
+
+def test_reads_stay_on_primary_after_write(replicas):
+    router = ReplicaRouter()
+
+    assert router.db_for_write(Token) == 'default'
+    assert router.db_for_read(User) == 'default'
+
+
+def test_replicas_are_not_migrated(replicas):
+    router = ReplicaRouter()
+
+    assert router.allow_migrate('replica_0', 'email_auth') is False
+    assert router.allow_migrate('default', 'email_auth') is None
+
+
+def test_client_which_wrote_is_pinned_to_primary(replicas):
+    router = ReplicaRouter()
+    reads = []
+
+    def write(request):
+        router.db_for_write(User)
+        return HttpResponse()
+
+    def read(request):
+        reads.append(router.db_for_read(User))
+        return HttpResponse()
+
+    factory = RequestFactory()
+    request = factory.get('/', HTTP_AUTHORIZATION='Token abc',
+                          REMOTE_ADDR='10.0.0.1')
+    ReplicaStickinessMiddleware(read)(request)
+    ReplicaStickinessMiddleware(write)(request)
+    ReplicaStickinessMiddleware(read)(request)
+    ReplicaStickinessMiddleware(read)(factory.get(
+        '/', HTTP_AUTHORIZATION='Token other', REMOTE_ADDR='10.0.0.2'))
+
+    assert reads == ['replica_0', 'default', 'replica_0']
+
+
+def test_clients_sharing_an_address_are_not_pinned_together(replicas):
+    router = ReplicaRouter()
+    reads = []
+
+    def write(request):
+        router.db_for_write(User)
+        return HttpResponse()
+
+    def read(request):
+        reads.append(router.db_for_read(User))
+        return HttpResponse()
+
+    factory = RequestFactory()
+    ReplicaStickinessMiddleware(write)(factory.get(
+        '/', HTTP_AUTHORIZATION='Token one', REMOTE_ADDR='10.0.0.1'))
+    ReplicaStickinessMiddleware(read)(factory.get(
+        '/', HTTP_AUTHORIZATION='Token two', REMOTE_ADDR='10.0.0.1'))
+    ReplicaStickinessMiddleware(read)(factory.get('/', REMOTE_ADDR='10.0.0.1'))
+
+    assert reads == ['replica_0', 'replica_0']
+
+
+def test_credentials_issued_by_login_are_pinned(replicas):
+    router = ReplicaRouter()
+    reads = []
+
+    def login(request):
+        router.db_for_write(Token)
+        pin_issued('Token issued')
+        return HttpResponse()
+
+    def read(request):
+        reads.append(router.db_for_read(User))
+        return HttpResponse()
+
+    factory = RequestFactory()
+    ReplicaStickinessMiddleware(login)(factory.post('/'))
+    ReplicaStickinessMiddleware(read)(factory.get(
+        '/', HTTP_AUTHORIZATION='Token issued'))
+
+    assert reads == ['default']
+
+
+def test_login_looks_user_up_on_primary(replicas, monkeypatch):
+    databases = []
+
+    def get_by_natural_key(manager, email):
+        databases.append(manager.db)
+        raise User.DoesNotExist
+
+    monkeypatch.setattr(type(User.objects), 'get_by_natural_key',
+                        get_by_natural_key)
+    routing_state.reset()
+
+    CustomBackend().authenticate(email='new@example.com', password='secret')
+
+    assert databases == ['default']
+
+
+def test_stickiness_requires_shared_backend(settings):
+    settings.REPLICA_ROUTING = {'ALIASES': ['replica_0']}
+
+    with pytest.raises(ImproperlyConfigured):
+        ReplicaStickinessMiddleware(lambda request: HttpResponse())
@@ -0,0 +1,42 @@
+"""Costs of the request handled by the current thread, see main.metrics"""
+import threading
+import time
+
+
+class RequestTimings(threading.local):
+    """Costs of the request handled by the current thread"""
+
+    def __init__(self):
+        super(RequestTimings, self).__init__()
+        self.reset()
+
+    def reset(self):
+        """Start measuring a new request"""
+        # pylint: disable=attribute-defined-outside-init
+        self.queries = 0
+        self.db = 0.0
+        self.hash = 0.0
+        self.serializer = 0.0
+
+    def add(self, name, seconds):
+        """Add seconds to timing name"""
+        setattr(self, name, getattr(self, name) + seconds)
+
+
+# pylint: disable=invalid-name
+request_timings = RequestTimings()
+
+
+class timed(object):
+    """Context manager adding its duration to a timing of request_timings"""
+    # pylint: disable=invalid-name,too-few-public-methods
+
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        request_timings.add(self.name, time.perf_counter() - self.started)
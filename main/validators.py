@@ -1,40 +1,175 @@
+"""
+Password policy of account application.
+
+``PasswordPolicyValidator`` checks length and the required character
+classes in one pass over the password, using a precomputed table of ASCII
+character classes, and reports every violation at once. Optionally the
+password is looked up in a list of breached passwords, see
+``BreachedPasswordList``.
+"""
+import hashlib
+import mmap
+import os
+import threading
+
 from django.core.exceptions import ValidationError
-from django.utils.translation import ugettext as _
-import re
+from django.utils.translation import ugettext as _, ungettext
+
+
+SPECIAL_CHARACTERS = '~!@#$%^&*()_+{}":;\'[]'
+
+DIGIT, LETTER, SPECIAL, OTHER = range(4)
+
+
+def _classify(char):
+    if char.isdigit():
+        return DIGIT
+    if char.isalpha():
+        return LETTER
+    if char in SPECIAL_CHARACTERS:
+        return SPECIAL
+    return OTHER
+
+
+# Classes of ASCII characters indexed by code point
+ASCII_CLASSES = tuple(_classify(chr(code)) for code in range(128))
+
+DIGEST_SIZE = hashlib.sha1().digest_size
+
+
+def password_digests(password):
+    """
+    SHA1 digests a password is looked up by: of the password itself and of
+    its normalized form, which lists of plain passwords are stored in
+    """
+    digests = {hashlib.sha1(password.encode('utf-8')).digest()}
+    digests.add(hashlib.sha1(
+        password.lower().strip().encode('utf-8')).digest())
+    return digests
+
+
+class BreachedPasswordList(object):
+    """
+    Sorted file of SHA1 digests of breached passwords, 20 bytes each, built
+    by ``manage.py build_password_list``. The file is memory-mapped on first
+    use and searched by bisection, so worker processes share its pages
+    instead of loading the list into each of them.
+    """
 
-class CustomPasswordValidator(object):
-    def __init__(self, min_length=1):
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _get_map(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    with open(self.path, 'rb') as digests:
+                        if os.fstat(digests.fileno()).st_size == 0:
+                            # Empty files can not be mapped
+                            self._map = b''
+                        else:
+                            self._map = mmap.mmap(digests.fileno(), 0,
+                                                  access=mmap.ACCESS_READ)
+        return self._map
+
+    def __len__(self):
+        return os.path.getsize(self.path) // DIGEST_SIZE
+
+    def _contains_digest(self, digest):
+        digests = self._get_map()
+        low, high = 0, len(digests) // DIGEST_SIZE
+        while low < high:
+            middle = (low + high) // 2
+            offset = middle * DIGEST_SIZE
+            current = digests[offset:offset + DIGEST_SIZE]
+            if current == digest:
+                return True
+            if current < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+    def __contains__(self, password):
+        return any(self._contains_digest(digest)
+                   for digest in password_digests(password))
+
+
+class PasswordPolicyValidator(object):
+    """
+    The password policy: at least min_length characters, min_digits digits,
+    min_letters letters and min_special characters of SPECIAL_CHARACTERS,
+    and not in the breached passwords list when its path is given.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, min_length=8, min_digits=1, min_letters=1,
+                 min_special=1, breached_passwords_path=None):
         self.min_length = min_length
+        self.minimums = (
+            (DIGIT, min_digits, 'password_needs_digits',
+             'Password must contain at least %(min_length)d digit.'),
+            (LETTER, min_letters, 'password_needs_alhpas',
+             'Password must contain at least %(min_length)d letter.'),
+            (SPECIAL, min_special, 'password_needs_special_chars',
+             'Password must contain at least %(min_length)d special '
+             'character. List of such characters %(special_characters)s.'),
+        )
+        self.breached_passwords = None
+        if breached_passwords_path:
+            self.breached_passwords = BreachedPasswordList(
+                breached_passwords_path)
+
+    @staticmethod
+    def count_classes(password):
+        """Return number of characters of every class"""
+        counts = [0, 0, 0, 0]
+        table = ASCII_CLASSES
+        for char in password:
+            code = ord(char)
+            counts[table[code] if code < 128 else _classify(char)] += 1
+        return counts
 
     def validate(self, password, user=None):
-        special_characters = "[~\!@#\$%\^&\*\(\)_\+{}\":;'\[\]]"
-
-        params = {
-            'min_length': self.min_length,
-            'special_characters': special_characters.replace('\\', '')
-        }
-        if not any(char.isdigit() for char in password):
-            raise ValidationError(
-                _('Password must contain at least %(min_length)d digit.'),
-                code='password_needs_digits',
+        errors = []
+        if len(password) < self.min_length:
+            errors.append(ValidationError(
+                ungettext(
+                    "This password is too short. It must contain at least "
+                    "%(min_length)d character.",
+                    "This password is too short. It must contain at least "
+                    "%(min_length)d characters.",
+                    self.min_length
+                ),
+                code='password_too_short',
                 params={'min_length': self.min_length},
-            )
-        if not any(char.isalpha() for char in password):
-            raise ValidationError(
-                _('Password must contain at least %(min_length)d letter.'),
-                code="password_needs_alhpas",
-                params = params
-            )
-        if not any(char in special_characters for char in password):
-            raise ValidationError(
-                _('Password must contain at least %(min_length)d special '
-                  'character. List of such characters %(special_characters)s.'),
-                code='password_needs_special_chars',
-                params=params
-            )
+            ))
+
+        counts = self.count_classes(password)
+        for char_class, minimum, code, message in self.minimums:
+            if counts[char_class] < minimum:
+                errors.append(ValidationError(_(message), code=code, params={
+                    'min_length': minimum,
+                    'special_characters': '[{}]'.format(SPECIAL_CHARACTERS),
+                }))
+
+        if self.breached_passwords is not None and \
+                password in self.breached_passwords:
+            errors.append(ValidationError(
+                _('This password has appeared in a data breach.'),
+                code='password_breached',
+            ))
+
+        if errors:
+            raise ValidationError(errors)
 
     def get_help_text(self):
+        minimums = [rule[1] for rule in self.minimums]
         return _(
-            "Your password must contain at least %(min_length)d characters."
-            % {'min_length': self.min_length}
-        )
+            "Your password must contain at least %(min_length)d characters, "
+            "%(digits)d digits, %(letters)d letters and %(special)d special "
+            "characters."
+        ) % dict(zip(('digits', 'letters', 'special'), minimums),
+                 min_length=self.min_length)
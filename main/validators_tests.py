@@ -0,0 +1,90 @@
+import hashlib
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+
+from main.validators import BreachedPasswordList, PasswordPolicyValidator
+
+
+def messages(validator, password):
+    with pytest.raises(ValidationError) as error:
+        validator.validate(password)
+    return error.value.messages
+
+
+def test_policy_reports_every_violation():
+    assert messages(PasswordPolicyValidator(), ' ') == [
+        'This password is too short. It must contain at least 8 characters.',
+        'Password must contain at least 1 digit.',
+        'Password must contain at least 1 letter.',
+        'Password must contain at least 1 special character. List of such '
+        'characters [~!@#$%^&*()_+{}":;\'[]].',
+    ]
+
+
+def test_policy_accepts_valid_password():
+    PasswordPolicyValidator().validate('123abc%%%')
+    PasswordPolicyValidator().validate('пароль1%')
+
+
+def test_policy_counts_minimums():
+    validator = PasswordPolicyValidator(min_digits=2, min_special=0)
+
+    assert messages(validator, 'abcdefg1') == \
+        ['Password must contain at least 2 digit.']
+
+
+def test_breached_passwords_are_rejected(tmpdir):
+    source = tmpdir.join('passwords.txt')
+    source.write('Summer2017!\n{}:42\n'.format(
+        hashlib.sha1(b'qwe123%%%').hexdigest().upper()))
+    output = tmpdir.join('passwords.bin')
+    call_command('build_password_list', str(source), str(output))
+    validator = PasswordPolicyValidator(breached_passwords_path=str(output))
+
+    assert len(BreachedPasswordList(str(output))) == 3
+    assert messages(validator, 'summer2017!') == \
+        ['This password has appeared in a data breach.']
+    assert messages(validator, 'qwe123%%%') == \
+        ['This password has appeared in a data breach.']
+    validator.validate('qwe123%%%a')
+
+
+def test_password_list_is_merged_from_sorted_chunks(tmpdir):
+    passwords = ['password{}!'.format(number) for number in range(50)]
+    source = tmpdir.join('passwords.txt')
+    source.write('\n'.join(passwords + passwords[:10]) + '\n')
+    output = tmpdir.join('passwords.bin')
+
+    call_command('build_password_list', str(source), str(output),
+                 chunk_size=7)
+
+    data = output.read_binary()
+    digests = [data[offset:offset + 20] for offset in range(0, len(data), 20)]
+    assert digests == sorted(set(digests))
+    assert len(digests) == 50
+    breached = BreachedPasswordList(str(output))
+    assert all(password in breached for password in passwords)
+    # Chunks are removed
+    assert sorted(tmpdir.listdir()) == sorted([output, source])
+
+
+def test_empty_password_list_is_not_written(tmpdir):
+    source = tmpdir.join('passwords.txt')
+    source.write('\n')
+    output = tmpdir.join('passwords.bin')
+
+    with pytest.raises(CommandError):
+        call_command('build_password_list', str(source), str(output))
+
+    assert not output.exists()
+
+
+def test_empty_password_list_file_rejects_nothing(tmpdir):
+    path = tmpdir.join('passwords.bin')
+    path.write_binary(b'')
+    validator = PasswordPolicyValidator(breached_passwords_path=str(path))
+
+    validator.validate('qwe123%%%')
+    assert len(BreachedPasswordList(str(path))) == 0